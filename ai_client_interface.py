@@ -1,6 +1,76 @@
+import asyncio
+import io
+import mmap
+import os
 from abc import ABC, abstractmethod
-from typing import Dict
-import base64
+from functools import lru_cache
+from typing import Dict, Iterator, List, Tuple
+
+try:
+    from pybase64 import b64decode, b64encode
+except ImportError:
+    from base64 import b64decode, b64encode
+
+# Pillow (already required by fpdf2) is optional here; without it images are sent as-is.
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# Larger photos are downscaled before upload; the models work at about this resolution anyway.
+_MAX_IMAGE_EDGE = 1024
+_JPEG_QUALITY = 85
+
+def _downscale_image_bytes(image_bytes: bytes) -> bytes:
+    """
+    Shrinks an image whose longest edge exceeds _MAX_IMAGE_EDGE (Lanczos resampling) and
+    re-encodes it as JPEG, cutting the upload size and the vision-input tokens.
+    Small images, data Pillow cannot decode, and installs without Pillow pass through unchanged.
+    """
+    if Image is None:
+        return image_bytes
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            if max(img.size) <= _MAX_IMAGE_EDGE:
+                return image_bytes
+            # Apply the EXIF orientation first, since saving drops the EXIF tag that phone photos rely on
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((_MAX_IMAGE_EDGE, _MAX_IMAGE_EDGE), Image.LANCZOS)
+            buffer = io.BytesIO()
+            img.convert("RGB").save(buffer, "JPEG", quality=_JPEG_QUALITY)
+            return buffer.getvalue()
+    except Exception:
+        return image_bytes
+
+# Leading bytes of the image formats phones and browsers upload, mapped to their MIME types
+_IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+def _image_mime_type(image_bytes: bytes) -> str:
+    """Identifies an image's MIME type from its leading bytes, defaulting to JPEG."""
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, mime_type in _IMAGE_SIGNATURES:
+        if image_bytes.startswith(signature):
+            return mime_type
+    return "image/jpeg"
+
+@lru_cache(maxsize=32)
+def _encode_image_file(image_path: str, mtime_ns: int, size: int) -> str:
+    """
+    Reads and base64-encodes an image file. The stat fields only serve as part of the cache key,
+    so repeated assessments of an unchanged file skip the read and encode, while an
+    overwritten file is picked up again. Shared by all clients.
+    """
+    try:
+        with open(image_path, "rb") as image_file:
+            return b64encode(_downscale_image_bytes(image_file.read())).decode('ascii')
+    except Exception as e:
+        raise IOError(f"Error reading image at {image_path}: {str(e)}")
 
 class AIClientInterface(ABC):
     """
@@ -13,13 +83,19 @@ class AIClientInterface(ABC):
         pass
 
     @abstractmethod
-    def expand_treatment_plan(self, original_analysis: str, assessment_data: Dict, wound_location: str) -> Dict:
-        """Generates an expanded, detailed treatment plan."""
+    def expand_treatment_plan(self, original_analysis: str, treatment_section: str = None) -> Dict:
+        """
+        Generates an expanded, detailed treatment plan.
+        `treatment_section` may carry the already-extracted Treatment Plan text.
+        """
         pass
 
     @abstractmethod
-    def revise_products(self, original_analysis: str, revision_reason: str) -> Dict:
-        """Regenerates product recommendations based on a specific constraint."""
+    def revise_products(self, original_analysis: str, revision_reason: str, current_products: str = None) -> Dict:
+        """
+        Regenerates product recommendations based on a specific constraint.
+        `current_products` may carry the already-extracted Recommended Products text.
+        """
         pass
 
     @abstractmethod
@@ -27,6 +103,69 @@ class AIClientInterface(ABC):
         """Analyzes a multi-page PDF of wound history and returns a healing percentage."""
         pass
 
+    async def get_initial_analysis_async(self, prompt: str, base64_image: str) -> str:
+        """
+        Async version of get_initial_analysis. By default the blocking call runs in a
+        worker thread; clients with a native async SDK path can override this.
+        """
+        return await asyncio.to_thread(self.get_initial_analysis, prompt, base64_image)
+
+    def get_initial_analysis_bytes(self, prompt: str, image_bytes: bytes) -> str:
+        """
+        Performs the primary wound analysis from raw image bytes.
+        Clients whose SDK accepts bytes directly should override this to skip the base64 encode.
+        """
+        return self.get_initial_analysis(prompt, self.encode_image_bytes(image_bytes))
+
+    async def get_initial_analysis_bytes_async(self, prompt: str, image_bytes: bytes) -> str:
+        """Async version of get_initial_analysis_bytes."""
+        return await self.get_initial_analysis_async(prompt, self.encode_image_bytes(image_bytes))
+
+    def get_initial_analysis_stream(self, prompt: str, base64_image: str) -> Iterator[str]:
+        """
+        Streaming version of get_initial_analysis that yields text chunks as they arrive.
+        By default the whole analysis is yielded as one chunk; clients that support streaming override this.
+        """
+        yield self.get_initial_analysis(prompt, base64_image)
+
+    def get_initial_analysis_batch(self, items: List[Tuple[str, str]]) -> List[str]:
+        """
+        Performs the primary wound analysis for several (prompt, base64_image) cases and
+        returns one analysis per case, in order. By default each case is a separate call;
+        clients that can analyze several images in one request should override this.
+        """
+        return [self.get_initial_analysis(prompt, base64_image) for prompt, base64_image in items]
+
+    async def expand_treatment_plan_async(self, original_analysis: str, treatment_section: str = None) -> Dict:
+        """Async version of expand_treatment_plan; runs the blocking call in a worker thread by default."""
+        return await asyncio.to_thread(self.expand_treatment_plan, original_analysis, treatment_section)
+
+    async def revise_products_async(self, original_analysis: str, revision_reason: str, current_products: str = None) -> Dict:
+        """Async version of revise_products; runs the blocking call in a worker thread by default."""
+        return await asyncio.to_thread(self.revise_products, original_analysis, revision_reason, current_products)
+
+    def expand_and_revise(self, original_analysis: str, revision_reason: str, treatment_section: str = None, current_products: str = None) -> Tuple[Dict, Dict]:
+        """
+        Runs both follow-ups for one analysis and returns (expand_result, revise_result).
+        By default they are separate calls; clients that can answer both in one request override this.
+        """
+        return (
+            self.expand_treatment_plan(original_analysis, treatment_section),
+            self.revise_products(original_analysis, revision_reason, current_products)
+        )
+
+    async def expand_and_revise_async(self, original_analysis: str, revision_reason: str, treatment_section: str = None, current_products: str = None) -> Tuple[Dict, Dict]:
+        """Async version of expand_and_revise; by default the two follow-ups run concurrently."""
+        expand_result, revise_result = await asyncio.gather(
+            self.expand_treatment_plan_async(original_analysis, treatment_section),
+            self.revise_products_async(original_analysis, revision_reason, current_products)
+        )
+        return expand_result, revise_result
+
+    async def get_healing_progress_async(self, pdf_path: str) -> Dict:
+        """Async version of get_healing_progress; runs the blocking call in a worker thread by default."""
+        return await asyncio.to_thread(self.get_healing_progress, pdf_path)
+
     # @abstractmethod
     # def get_tissue_percentages_over_time(self, original_analysis: str, assessment_data: Dict, wound_location: str) -> Dict:
     #     """Generates a projection of tissue composition percentages over time."""
@@ -37,12 +176,54 @@ class AIClientInterface(ABC):
     #     """Generates a concise, clinical wound summary."""
     #     pass
 
-    def encode_image(self, image_path: str) -> str:
-        """Encodes an image file to a base64 string (concrete implementation)."""
+    def read_image(self, image_path: str) -> bytes:
+        """Reads an image file into memory (concrete implementation)."""
         try:
             with open(image_path, "rb") as image_file:
-                return base64.b64encode(image_file.read()).decode('utf-8')
+                return image_file.read()
         except FileNotFoundError:
             raise FileNotFoundError(f"Image file not found at path: {image_path}")
         except Exception as e:
-            raise IOError(f"Error encoding image at {image_path}: {str(e)}")
+            raise IOError(f"Error reading image at {image_path}: {str(e)}")
+
+    def encode_image(self, image_path: str) -> str:
+        """Encodes an image file to a base64 string, reusing the result while the file is unchanged."""
+        try:
+            st = os.stat(image_path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Image file not found at path: {image_path}")
+        return _encode_image_file(image_path, st.st_mtime_ns, st.st_size)
+
+    def encode_image_bytes(self, image_bytes: bytes) -> str:
+        """Encodes raw image bytes (e.g. an in-memory upload) to a base64 string, downscaling large images first."""
+        return b64encode(_downscale_image_bytes(image_bytes)).decode('ascii')
+
+    def encode_pdf(self, pdf_path: str) -> str:
+        """Base64-encodes a PDF (e.g. the healing history) for an inline multimodal request."""
+        print(f"DEBUG: Reading PDF {pdf_path} for {type(self).__name__} multimodal request...")
+        # Encode straight from a memory map of the file so no separate copy of the PDF bytes is made;
+        # base64 output is pure ASCII. Zero-length files cannot be mapped.
+        with open(pdf_path, "rb") as pdf_file:
+            if os.fstat(pdf_file.fileno()).st_size:
+                with mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_READ) as pdf_map:
+                    return b64encode(pdf_map).decode('ascii')
+        return ""
+
+    def prepare_image_bytes(self, image_bytes: bytes) -> Tuple[bytes, str]:
+        """
+        Returns raw image bytes ready to send as-is, with their MIME type. Large images are
+        downscaled (and so re-encoded as JPEG) first; others keep their original format.
+        """
+        image_bytes = _downscale_image_bytes(image_bytes)
+        return image_bytes, _image_mime_type(image_bytes)
+
+    def image_mime_type(self, image_bytes: bytes) -> str:
+        """Returns the MIME type of raw image bytes (e.g. a decoded base64 image), defaulting to JPEG."""
+        return _image_mime_type(image_bytes)
+
+    def decode_image(self, base64_image: str) -> bytes:
+        """Decodes a base64 image string, rejecting input that is not valid base64."""
+        try:
+            return b64decode(base64_image, validate=True)
+        except ValueError as e:
+            raise ValueError(f"Invalid base64 image data: {str(e)}")
@@ -1,26 +1,54 @@
 from fastapi import FastAPI, File, UploadFile, Form, Depends, HTTPException
-from fastapi.responses import JSONResponse
-import shutil
-import os
+from fastapi.responses import JSONResponse, ORJSONResponse
+from starlette.formparsers import MultiPartParser
 from typing import Dict
+from functools import lru_cache
+import asyncio
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Import our schemas and the main facade
 from . import schemas
 from main import NurseLensFacade
+from response_cache import ResponseCache, make_cache_key
 
 # --- App Initialization ---
 app = FastAPI(
     title="NurseLens AI API",
     description="API for advanced wound analysis using AI.",
-    version="1.0.0"
+    version="1.0.0",
+    # Serialize responses with orjson when it is installed; it is noticeably faster for the large plan payloads.
+    default_response_class=ORJSONResponse if orjson is not None else JSONResponse
 )
 
+# Uploads are spooled to disk once they pass 1 MB by default. Typical wound photos are
+# 2-8 MB, so raise the threshold to keep the whole upload path in memory.
+_UPLOAD_SPOOL_MAX_SIZE = 16 * 1024 * 1024
+if hasattr(MultiPartParser, "spool_max_size"):
+    MultiPartParser.spool_max_size = _UPLOAD_SPOOL_MAX_SIZE
+else:  # Older Starlette releases call this attribute max_file_size
+    MultiPartParser.max_file_size = _UPLOAD_SPOOL_MAX_SIZE
+
 # --- Dependency Injection for the Facade ---
 # This is a smart way to manage the facade instance.
 # We can easily switch models here, e.g., by getting the model from a header or query param.
+# Facades are cached per model so the AI client is built once per process, not on every request.
+# Endpoints pass their inputs explicitly and the facade keeps no per-analysis state,
+# so one instance is safe across concurrent requests.
+@lru_cache(maxsize=8)
+def _get_facade(model_name: str) -> NurseLensFacade:
+    return NurseLensFacade(model_name=model_name, remember_last_analysis=False)
+
 def get_ai_system() -> NurseLensFacade:
     # For now, we hardcode gpt-4o, but this could be made dynamic.
-    return NurseLensFacade(model_name="gpt-4o")
+    return _get_facade("gpt-4o")
+
+# Recent initial analyses keyed on the uploaded bytes and form data, so identical
+# re-submissions within five minutes skip the multi-second model round-trip.
+_ANALYSIS_CACHE = ResponseCache(maxsize=256, ttl=300)
 
 # --- API Endpoints ---
 
@@ -41,35 +69,32 @@ async def create_initial_analysis(
     This endpoint accepts multipart/form-data. You must send the image as a file
     and the other parameters as form fields.
     """
-    # Create a temporary directory to save the uploaded image
-    temp_dir = "temp_images"
-    os.makedirs(temp_dir, exist_ok=True)
-    temp_image_path = os.path.join(temp_dir, image.filename)
-
-    try:
-        # Save the uploaded file to the temporary path
-        with open(temp_image_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
-
-        # Convert the Pydantic model to a dictionary for the facade
-        assessment_params = assessment_data.model_dump()
-
-        # Call our existing facade method with the saved image path and data
-        result = ai_system.analyze_wound_with_image(
-            image_path=temp_image_path,
-            wound_location=wound_location,
-            **assessment_params
-        )
-
-        if not result["success"]:
-            raise HTTPException(status_code=500, detail=result.get("error", "An unknown error occurred during analysis."))
-        
-        return result
+    # Read the upload straight into memory; no temporary file on disk is needed
+    image_bytes = await image.read()
+
+    # Convert the Pydantic model to a dictionary for the facade. The model is flat,
+    # so reading the fields directly avoids model_dump()'s full serialization walk.
+    assessment_params = {field: getattr(assessment_data, field) for field in schemas.ClinicalAssessment.model_fields}
+
+    cache_key = make_cache_key(image_bytes, assessment_params, wound_location)
+    cached_result = _ANALYSIS_CACHE.get(cache_key)
+    if cached_result is not None:
+        return cached_result
+
+    # Call our existing facade method with the raw image bytes and data.
+    # The facade blocks on the AI provider, so run it in a worker thread to keep the event loop free.
+    result = await asyncio.to_thread(
+        ai_system.analyze_wound_with_image,
+        image_bytes=image_bytes,
+        wound_location=wound_location,
+        **assessment_params
+    )
 
-    finally:
-        # Clean up: always remove the temporary image file
-        if os.path.exists(temp_image_path):
-            os.remove(temp_image_path)
+    if not result["success"]:
+        raise HTTPException(status_code=500, detail=result.get("error", "An unknown error occurred during analysis."))
+    
+    _ANALYSIS_CACHE.set(cache_key, result)
+    return result
 
 
 @app.post("/analysis/expand-treatment-plan", tags=["Follow-up Actions"])
@@ -82,10 +107,8 @@ async def expand_treatment_plan(
     
     You must provide the raw text (`original_analysis`) from the response of the `/analysis/initial` endpoint.
     """
-    # The facade needs the raw text analysis to be stored first
-    ai_system.last_analysis = request.original_analysis
-    
-    result = ai_system.expand_last_treatment_plan()
+    # Pass the raw text analysis explicitly rather than storing it on the shared facade
+    result = await asyncio.to_thread(ai_system.expand_last_treatment_plan, original_analysis=request.original_analysis)
 
     if not result["success"]:
         raise HTTPException(status_code=500, detail=result.get("error", "Failed to expand treatment plan."))
@@ -104,13 +127,40 @@ async def revise_products(
     You must provide the raw text (`original_analysis`) from the response of the
     `/analysis/initial` endpoint.
     """
-    # Store the necessary context on the facade instance
-    ai_system.last_analysis = request.original_analysis
-    
-    result = ai_system.revise_last_products(revision_reason=request.revision_reason)
+    # Pass the necessary context explicitly rather than storing it on the shared facade
+    result = await asyncio.to_thread(
+        ai_system.revise_last_products,
+        revision_reason=request.revision_reason,
+        original_analysis=request.original_analysis
+    )
 
     if not result["success"]:
         raise HTTPException(status_code=500, detail=result.get("error", "Failed to revise products."))
         
     return result
 
+
+@app.post("/analysis/follow-ups", tags=["Follow-up Actions"])
+async def run_follow_ups(
+    request: schemas.FollowUpsRequest,
+    ai_system: NurseLensFacade = Depends(get_ai_system)
+):
+    """
+    Expands the treatment plan and revises the products of a previous analysis together.
+    Both follow-ups are sent concurrently, or as one combined request when the client is
+    configured with combine_follow_ups.
+
+    You must provide the raw text (`original_analysis`) from the response of the
+    `/analysis/initial` endpoint.
+    """
+    # The client calls are natively async, so no worker thread is needed here
+    expand_result, revise_result = await ai_system.run_follow_ups_async(
+        revision_reason=request.revision_reason,
+        original_analysis=request.original_analysis
+    )
+
+    if not expand_result["success"] and not revise_result["success"]:
+        raise HTTPException(status_code=500, detail=expand_result.get("error", "Failed to run the follow-ups."))
+
+    return {"expanded_plan": expand_result, "revised_products": revise_result}
+
@@ -36,3 +36,10 @@ class ReviseProductsRequest(BaseModel):
     original_analysis: str = Field(..., description="The full, raw text output from the initial analysis.")
     revision_reason: str = Field(..., description="The reason for revision, e.g., 'Too Costly'.")
 
+# --- Models for the combined Follow-ups Endpoint ---
+
+class FollowUpsRequest(BaseModel):
+    """Defines the request body for expanding the treatment plan and revising products together."""
+    original_analysis: str = Field(..., description="The full, raw text output from the initial analysis.")
+    revision_reason: str = Field(..., description="The reason for revision, e.g., 'Too Costly'.")
+
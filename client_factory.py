@@ -1,15 +1,32 @@
+import importlib
+import logging
+import threading
 from ai_client_interface import AIClientInterface
-from openai_client import OpenAIClient
-from gemini_client import GeminiClient
-from grok_client import GrokClient
 
-def get_ai_client(model_name: str) -> AIClientInterface:
+# Maps a substring of the model name to the (module, class) that serves it.
+# Client modules are imported only when first needed, so a process that uses one
+# provider never pays the import cost of the other SDKs.
+_CLIENT_CTORS = {
+    "gpt": ("openai_client", "OpenAIClient"),
+    "gemini": ("gemini_client", "GeminiClient"),
+    "grok": ("grok_client", "GrokClient"),
+}
+
+# Clients are expensive to build (env loading, SDK setup), so one instance is kept per model name and options.
+_CLIENT_CACHE = {}
+_CLIENT_CACHE_LOCK = threading.Lock()
+
+_logger = logging.getLogger(__name__)
+
+def get_ai_client(model_name: str, **client_options) -> AIClientInterface:
     """
     Factory function to select and return the appropriate AI client instance
-    based on the provided model name.
+    based on the provided model name. Instances are created once and reused.
 
     Args:
         model_name (str): The name of the model to use (e.g., 'gpt-4o', 'gemini-pro-vision', 'grok-4').
+        **client_options: Extra constructor arguments of the selected client
+            (e.g. use_file_uploads=True for OpenAIClient). Each distinct set gets its own instance.
 
     Returns:
         An instance of a class that implements AIClientInterface.
@@ -17,19 +34,22 @@ def get_ai_client(model_name: str) -> AIClientInterface:
     Raises:
         ValueError: If the model_name is not supported.
     """
-    model_name_lower = model_name.lower()
+    cache_key = (model_name, tuple(sorted(client_options.items())))
+    client = _CLIENT_CACHE.get(cache_key)
+    if client is not None:
+        return client
 
-    if "gpt" in model_name_lower:
-        print(f"Initializing OpenAI client for model: {model_name}")
-        return OpenAIClient(model=model_name)
-    
-    elif "gemini" in model_name_lower:
-        print(f"Initializing Gemini client for model: {model_name}")
-        return GeminiClient(model=model_name)
-    
-    elif "grok" in model_name_lower:
-        print(f"Initializing Grok client for model: {model_name}")
-        return GrokClient(model=model_name)
-    
-    else:
+    model_name_lower = model_name.lower()
+    client_path = next((ctor for prefix, ctor in _CLIENT_CTORS.items() if prefix in model_name_lower), None)
+    if client_path is None:
         raise ValueError(f"Unsupported model: '{model_name}'. No client available.")
+
+    with _CLIENT_CACHE_LOCK:
+        client = _CLIENT_CACHE.get(cache_key)
+        if client is None:
+            module_name, class_name = client_path
+            client_class = getattr(importlib.import_module(module_name), class_name)
+            _logger.debug("Initializing %s for model: %s (options: %s)", client_class.__name__, model_name, client_options)
+            client = client_class(model=model_name, **client_options)
+            _CLIENT_CACHE[cache_key] = client
+    return client
@@ -1,37 +1,49 @@
 from datetime import datetime
 
+def _titled(*keys: str) -> list:
+    """Pairs each flag key with its display name, e.g. 'caregiver_support' -> 'Caregiver Support'."""
+    return [(key, key.replace('_', ' ').title()) for key in keys]
+
+# Flag groups for each output bucket, with display names precomputed once at import time.
+# Note: The lists here are abbreviated for clarity. Add all original items.
+_PATIENT_OVERVIEW_GROUPS = {
+    "health_risk_factors": _titled("diabetes", "peripheral_arterial_disease"),
+    "mobility": _titled("ambulatory", "wheelchair_dependent", "bedbound"),
+    "living_situation": _titled("alone", "caregiver_support", "facility"),
+}
+_CLINICAL_ASSESSMENT_GROUPS = {
+    "drainage_amount": _titled("drainage_none", "drainage_scant"),
+    "drainage_type": _titled("serous", "sanguinous", "purulent"),
+    "odor_assessment": _titled("odor_absent", "odor_present", "odor_foul"),
+    "peri_wound_skin_temperature": _titled("temperature_same", "temperature_warmer_hot"),
+}
+
 class ClinicalDataFormatter:
     """Handles the formatting of clinical data and generation of prompts."""
 
-    def format_assessment_data(self, **kwargs) -> dict:
+    def format_assessment_data(self, now: datetime = None, **kwargs) -> dict:
         """
         Formats boolean flags and other inputs into a structured dictionary.
         This method is more dynamic than the original.
+        Pass `now` to reuse a timestamp the caller already has.
         """
+        now = now or datetime.now()
+        clinical_assessment = self._collect_groups(kwargs, _CLINICAL_ASSESSMENT_GROUPS)
+        clinical_assessment["other_relevant_information"] = kwargs.get("other_information", "")
         assessment_data = {
-            "timestamp": datetime.now().isoformat(),
-            "patient_overview": {
-                "health_risk_factors": self._collect_items(kwargs, ["diabetes", "peripheral_arterial_disease"]),
-                "mobility": self._collect_items(kwargs, ["ambulatory", "wheelchair_dependent", "bedbound"]),
-                "living_situation": self._collect_items(kwargs, ["alone", "caregiver_support", "facility"]),
-            },
-            "clinical_assessment": {
-                "drainage_amount": self._collect_items(kwargs, ["drainage_none", "drainage_scant"]),
-                "drainage_type": self._collect_items(kwargs, ["serous", "sanguinous", "purulent"]),
-                "odor_assessment": self._collect_items(kwargs, ["odor_absent", "odor_present", "odor_foul"]),
-                "peri_wound_skin_temperature": self._collect_items(kwargs, ["temperature_same", "temperature_warmer_hot"]),
-                "other_relevant_information": kwargs.get("other_information", "")
-            }
+            "timestamp": now.isoformat(),
+            "patient_overview": self._collect_groups(kwargs, _PATIENT_OVERVIEW_GROUPS),
+            "clinical_assessment": clinical_assessment
         }
-        # Note: The lists in _collect_items are abbreviated for clarity. Add all original items.
         return assessment_data
 
-    def _collect_items(self, source: dict, keys: list) -> list:
-        """Helper to collect true flags from a dictionary."""
-        return [key.replace('_', ' ').title() for key in keys if source.get(key)]
+    def _collect_groups(self, source: dict, groups: dict) -> dict:
+        """Helper to collect the display names of true flags for every bucket in a single pass."""
+        return {bucket: [title for key, title in group if source.get(key)] for bucket, group in groups.items()}
 
     def create_main_analysis_prompt(self, assessment_data: dict, wound_location: str, current_date: str) -> str:
         """Creates the full text prompt for the initial AI analysis."""
+        overview = assessment_data['patient_overview']
         clinical = assessment_data['clinical_assessment']
         
         # Helper to safely get the first item or a default value
@@ -39,36 +51,44 @@ class ClinicalDataFormatter:
             return data_list[0] if data_list else default
 
         # Construct the prompt with exact details for the 'Case Information' section
-        prompt = f"""
-        For the Case Information section, use these exact details:
-        - Case Date: {current_date}
-        - Wound Location: {wound_location}
-        - Drainage Amount: {get_first_or_default(clinical['drainage_amount'])}
-        - Drainage Type: {get_first_or_default(clinical['drainage_type'])}
-        - Odor Assessment: {get_first_or_default(clinical['odor_assessment'])}
-        - Additional Clinical Info: {clinical.get('other_relevant_information') or 'None'}
-
-        WOUND ASSESSMENT REQUEST - {current_date}
+        parts = [
+            "For the Case Information section, use these exact details:",
+            f"- Case Date: {current_date}",
+            f"- Wound Location: {wound_location}",
+            f"- Drainage Amount: {get_first_or_default(clinical['drainage_amount'])}",
+            f"- Drainage Type: {get_first_or_default(clinical['drainage_type'])}",
+            f"- Odor Assessment: {get_first_or_default(clinical['odor_assessment'])}",
+            f"- Additional Clinical Info: {clinical.get('other_relevant_information') or 'None'}",
+            "",
+            f"WOUND ASSESSMENT REQUEST - {current_date}",
+            "",
+            "Analyze the wound image and integrate with the following clinical data to provide a structured response:",
+            "",
+        ]
 
-        Analyze the wound image and integrate with the following clinical data to provide a structured response:
-        
-        {self._format_prompt_section("HEALTH RISK FACTORS", assessment_data['patient_overview']['health_risk_factors'])}
-        {self._format_prompt_section("MOBILITY", assessment_data['patient_overview']['mobility'])}
-        {self._format_prompt_section("LIVING SITUATION", assessment_data['patient_overview']['living_situation'])}
-
-        CLINICAL ASSESSMENT:
-        {self._format_prompt_section("Drainage Amount", clinical['drainage_amount'])}
-        {self._format_prompt_section("Drainage Type", clinical['drainage_type'])}
-        {self._format_prompt_section("Odor Assessment", clinical['odor_assessment'])}
-        {self._format_prompt_section("Peri-wound Skin Temperature", clinical['peri_wound_skin_temperature'])}
-        {self._format_prompt_section("Other Relevant Information", [clinical['other_relevant_information']])}
+        # Sections are only included when data is available
+        patient_sections = (
+            ("HEALTH RISK FACTORS", overview['health_risk_factors']),
+            ("MOBILITY", overview['mobility']),
+            ("LIVING SITUATION", overview['living_situation']),
+        )
+        clinical_sections = (
+            ("DRAINAGE AMOUNT", clinical['drainage_amount']),
+            ("DRAINAGE TYPE", clinical['drainage_type']),
+            ("ODOR ASSESSMENT", clinical['odor_assessment']),
+            ("PERI-WOUND SKIN TEMPERATURE", clinical['peri_wound_skin_temperature']),
+            ("OTHER RELEVANT INFORMATION", [clinical['other_relevant_information']]),
+        )
+        for title, items in patient_sections:
+            if items and items[0]:
+                parts.append(f"{title}: {', '.join(items)}")
 
-        Based on your visual analysis of the wound image and the clinical data provided, provide your assessment in the exact format shown in the example.
-        """
-        return prompt
+        parts.append("")
+        parts.append("CLINICAL ASSESSMENT:")
+        for title, items in clinical_sections:
+            if items and items[0]:
+                parts.append(f"{title}: {', '.join(items)}")
 
-    def _format_prompt_section(self, title: str, items: list) -> str:
-        """Formats a section of the prompt if data is available."""
-        if not items or not items[0]:
-            return ""
-        return f"{title.upper()}: {', '.join(items)}\n"
+        parts.append("")
+        parts.append("Based on your visual analysis of the wound image and the clinical data provided, provide your assessment in the exact format shown in the example.")
+        return "\n".join(parts)
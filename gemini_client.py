@@ -1,35 +1,33 @@
 import os
-import re
+import asyncio
 import json
-import base64
 import google.generativeai as genai
 from dotenv import load_dotenv
 from ai_client_interface import AIClientInterface
+from response_cache import ResponseCache, make_cache_key
+from response_parser import parse_sections
 from typing import Dict, List
 
-class GeminiClient(AIClientInterface):
-    """The concrete implementation of the AIClientInterface for Google's Gemini models."""
-    
-    def __init__(self, api_key: str = None, model: str = "gemini-1.5-pro-latest"):
-        load_dotenv()
-        self.api_key = api_key or os.getenv("GEMINI_API_KEY")
-        if not self.api_key:
-            raise ValueError("GEMINI_API_KEY not found in environment variables.")
-        
-        genai.configure(api_key=self.api_key)
-        
-        safety_settings = [
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-        ]
-        
-        self.model_name = model
-        self.model = genai.GenerativeModel(self.model_name, safety_settings=safety_settings)
-        
-        # --- THIS IS THE NEW, MORE FORCEFUL PROMPT ---
-        self.clinical_protocol = """
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so existing except clauses still apply.
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+# Responses are shared across GeminiClient instances; keys include the model name.
+_RESPONSE_CACHE = ResponseCache(maxsize=512)
+
+# Product revision instructions per revision reason; "Other" and unexpected values use the default.
+_REVISION_INSTRUCTIONS = {
+    "Patient Won't Tolerate": "Focus on gentle, hypoallergenic products that are comfortable for sensitive patients. Avoid aggressive treatments and prioritize patient comfort.",
+    "Too Costly": "Recommend cost-effective, generic alternatives and basic wound care supplies. Focus on essential products only and suggest budget-friendly options.",
+    "Products Unavailable": "Suggest readily available alternatives that can be found in most pharmacies or medical supply stores. Include multiple product options."
+}
+_DEFAULT_REVISION_INSTRUCTION = "Provide alternative product recommendations with different mechanisms of action or formulations."
+
+# --- THIS IS THE NEW, MORE FORCEFUL PROMPT ---
+# Module-level so every instance shares it; sent as its own prompt part rather than concatenated per call.
+_CLINICAL_PROTOCOL = """
         You are a world-class dermatologist AI. Your task is to analyze the provided wound image and clinical data.
         Your response MUST be a single block of text.
         You MUST use the following seven section headers and NOTHING ELSE:
@@ -100,50 +98,143 @@ class GeminiClient(AIClientInterface):
         Your final output MUST contain all seven of the specified sections, formatted correctly.
         """
 
-    def _make_api_call(self, prompt_parts: List, max_tokens: int, temperature: float, is_json: bool = False) -> str:
+class GeminiClient(AIClientInterface):
+    """The concrete implementation of the AIClientInterface for Google's Gemini models."""
+    
+    def __init__(self, api_key: str = None, model: str = "gemini-1.5-pro-latest"):
+        load_dotenv()
+        self.api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not self.api_key:
+            raise ValueError("GEMINI_API_KEY not found in environment variables.")
+        
+        genai.configure(api_key=self.api_key)
+        
+        safety_settings = [
+            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+        ]
+        
+        self.model_name = model
+        self.model = genai.GenerativeModel(self.model_name, safety_settings=safety_settings)
+
+    def _build_generation_config(self, max_tokens: int, temperature: float, is_json: bool) -> Dict:
+        """Builds the generation config shared by the sync and async API call helpers."""
+        generation_config = {
+            "temperature": temperature,
+            "max_output_tokens": max_tokens,
+        }
+        if is_json:
+            generation_config["response_mime_type"] = "application/json"
+        return generation_config
+
+    def _extract_text(self, response) -> str:
+        """Returns the response text, raising if the response was empty or blocked."""
+        if not response.candidates or response.candidates[0].finish_reason.name != "STOP":
+            reason = "UNKNOWN"
+            if response.candidates:
+                reason = response.candidates[0].finish_reason.name
+            raise Exception(f"AI response was empty or blocked by the provider for reason: {reason}.")
+
+        # Most responses are a single text part; read it directly instead of going
+        # through response.text, which re-validates and joins every part.
+        parts = response.candidates[0].content.parts
+        if len(parts) == 1:
+            return parts[0].text
+        return response.text
+
+    def _make_api_call(self, prompt_parts: List, max_tokens: int, temperature: float, is_json: bool = False, use_cache: bool = True) -> str:
         """
         A single, reliable method for making all Gemini API calls,
         with robust checking for blocked responses.
+        Identical requests (same model, prompt parts and config) are served from an in-memory cache.
         """
         try:
-            generation_config = {
-                "temperature": temperature,
-                "max_output_tokens": max_tokens,
-            }
-            if is_json:
-                generation_config["response_mime_type"] = "application/json"
+            generation_config = self._build_generation_config(max_tokens, temperature, is_json)
+            cache_key = make_cache_key(self.model_name, prompt_parts, generation_config)
+            if use_cache:
+                cached_text = _RESPONSE_CACHE.get(cache_key)
+                if cached_text is not None:
+                    print("DEBUG: Returning cached Gemini response.")
+                    return cached_text
 
             response = self.model.generate_content(prompt_parts, generation_config=generation_config)
-            
-            if not response.candidates or response.candidates[0].finish_reason.name != "STOP":
-                reason = "UNKNOWN"
-                if response.candidates:
-                    reason = response.candidates[0].finish_reason.name
-                raise Exception(f"AI response was empty or blocked by the provider for reason: {reason}.")
+            response_text = self._extract_text(response)
+            if use_cache:
+                _RESPONSE_CACHE.set(cache_key, response_text)
+            return response_text
+        except Exception as e:
+            error_message = f"Google Gemini API call failed: {str(e)}"
+            print(f"CRITICAL API ERROR: {error_message}")
+            raise Exception(error_message)
 
-            return response.text
+    async def _make_api_call_async(self, prompt_parts: List, max_tokens: int, temperature: float, is_json: bool = False, use_cache: bool = True) -> str:
+        """Async counterpart of _make_api_call; awaits the SDK instead of blocking the event loop."""
+        try:
+            generation_config = self._build_generation_config(max_tokens, temperature, is_json)
+            cache_key = make_cache_key(self.model_name, prompt_parts, generation_config)
+            if use_cache:
+                cached_text = _RESPONSE_CACHE.get(cache_key)
+                if cached_text is not None:
+                    print("DEBUG: Returning cached Gemini response.")
+                    return cached_text
+
+            response = await self.model.generate_content_async(prompt_parts, generation_config=generation_config)
+            response_text = self._extract_text(response)
+            if use_cache:
+                _RESPONSE_CACHE.set(cache_key, response_text)
+            return response_text
         except Exception as e:
             error_message = f"Google Gemini API call failed: {str(e)}"
             print(f"CRITICAL API ERROR: {error_message}")
             raise Exception(error_message)
 
+    def _initial_analysis_parts(self, prompt: str, image_bytes: bytes, mime_type: str) -> List:
+        """Builds the prompt parts for the primary wound analysis."""
+        print("DEBUG: Constructing multimodal message for Gemini.")
+        return [_CLINICAL_PROTOCOL, prompt, {"mime_type": mime_type, "data": image_bytes}]
+
     def get_initial_analysis(self, prompt: str, base64_image: str) -> str:
         """Performs the primary wound analysis with an image using Gemini."""
-        print("DEBUG: Constructing multimodal message for Gemini.")
-        image_part = {"mime_type": "image/jpeg", "data": base64.b64decode(base64_image)}
-        text_part = self.clinical_protocol + "\n\n" + prompt
-        prompt_parts = [text_part, image_part]
-        
+        # encode_image/encode_image_bytes already downscaled the image before encoding it
+        image_bytes = self.decode_image(base64_image)
+        prompt_parts = self._initial_analysis_parts(prompt, image_bytes, self.image_mime_type(image_bytes))
+
         print("DEBUG: Sending request to Gemini for image analysis...")
         return self._make_api_call(prompt_parts=prompt_parts, max_tokens=4096, temperature=0.2)
 
-    def expand_treatment_plan(self, original_analysis: str) -> Dict:
+    def get_initial_analysis_bytes(self, prompt: str, image_bytes: bytes) -> str:
+        """Gemini accepts raw image bytes, so no base64 round-trip is needed; large uploads are downscaled first."""
+        prompt_parts = self._initial_analysis_parts(prompt, *self.prepare_image_bytes(image_bytes))
+
+        print("DEBUG: Sending request to Gemini for image analysis...")
+        return self._make_api_call(prompt_parts=prompt_parts, max_tokens=4096, temperature=0.2)
+
+    async def get_initial_analysis_async(self, prompt: str, base64_image: str) -> str:
+        """Async version of get_initial_analysis using the SDK's native async call."""
+        image_bytes = self.decode_image(base64_image)
+        prompt_parts = self._initial_analysis_parts(prompt, image_bytes, self.image_mime_type(image_bytes))
+
+        print("DEBUG: Sending async request to Gemini for image analysis...")
+        return await self._make_api_call_async(prompt_parts=prompt_parts, max_tokens=4096, temperature=0.2)
+
+    async def get_initial_analysis_bytes_async(self, prompt: str, image_bytes: bytes) -> str:
+        """Async version of get_initial_analysis_bytes using the SDK's native async call."""
+        # Downscaling decodes and re-encodes the image, so it runs off the event loop
+        image_bytes, mime_type = await asyncio.to_thread(self.prepare_image_bytes, image_bytes)
+        prompt_parts = self._initial_analysis_parts(prompt, image_bytes, mime_type)
+
+        print("DEBUG: Sending async request to Gemini for image analysis...")
+        return await self._make_api_call_async(prompt_parts=prompt_parts, max_tokens=4096, temperature=0.2)
+
+    def expand_treatment_plan(self, original_analysis: str, treatment_section: str = None) -> Dict:
         """Generates an expanded treatment plan as JSON using Gemini."""
         try:
-            treatment_section_match = re.search(r'\*\*Treatment Plan:\*\*(.*?)\*\*Recommended Products:\*\*', original_analysis, re.DOTALL)
-            if not treatment_section_match:
+            if treatment_section is None:
+                treatment_section = parse_sections(original_analysis).get("Treatment Plan")
+            if treatment_section is None:
                 return {"success": False, "error": "Could not find 'Treatment Plan' to expand."}
-            treatment_section = treatment_section_match.group(1).strip()
 
             one_shot_example = """
             "recommendations": [{"action": "...", "rationale": "..."}],
@@ -164,13 +255,11 @@ class GeminiClient(AIClientInterface):
             Now, generate the JSON for the following case:
             **Original Brief Treatment Plan:** {treatment_section}
             """
-            full_prompt = system_prompt + "\n\n" + user_prompt
-            
-            response_text = self._make_api_call(prompt_parts=[full_prompt], max_tokens=2000, temperature=0.1)
+            # JSON mode guarantees a bare JSON body, so no fence stripping is needed before parsing.
+            response_text = self._make_api_call(prompt_parts=[system_prompt, user_prompt], max_tokens=2000, temperature=0.1, is_json=True)
             
             try:
-                cleaned_text = re.sub(r'```json\s*|\s*```', '', response_text).strip()
-                json_response = json.loads(cleaned_text)
+                json_response = json_loads(response_text)
                 return {"success": True, "expanded_plan_json": json_response}
             except json.JSONDecodeError:
                 return {"success": False, "error": "Failed to decode Gemini's JSON response.", "raw_response": response_text}
@@ -178,21 +267,14 @@ class GeminiClient(AIClientInterface):
         except Exception as e:
             return {"success": False, "error": f"Error in Gemini expand_treatment_plan: {str(e)}"}
 
-    def revise_products(self, original_analysis: str, revision_reason: str) -> Dict:
+    def revise_products(self, original_analysis: str, revision_reason: str, current_products: str = None) -> Dict:
         """Revises product recommendations as JSON using Gemini."""
         try:
-            if revision_reason == "Patient Won't Tolerate":
-                instruction = "Focus on gentle, hypoallergenic products that are comfortable for sensitive patients. Avoid aggressive treatments and prioritize patient comfort."
-            elif revision_reason == "Too Costly":
-                instruction = "Recommend cost-effective, generic alternatives and basic wound care supplies. Focus on essential products only and suggest budget-friendly options."
-            elif revision_reason == "Products Unavailable":
-                instruction = "Suggest readily available alternatives that can be found in most pharmacies or medical supply stores. Include multiple product options."
-            else:  # This handles the "Other" case or any unexpected values.
-                instruction = "Provide alternative product recommendations with different mechanisms of action or formulations."
-            products_match = re.search(r'\*\*Recommended Products:\*\*(.*?)\*\*Wound Tissue Evaluation:\*\*', original_analysis, re.DOTALL)
-            if not products_match:
+            instruction = _REVISION_INSTRUCTIONS.get(revision_reason, _DEFAULT_REVISION_INSTRUCTION)
+            if current_products is None:
+                current_products = parse_sections(original_analysis).get("Recommended Products")
+            if current_products is None:
                 return {"success": False, "error": "Could not find 'Recommended Products' to revise."}
-            current_products = products_match.group(1).strip()
 
             system_prompt = "You are a JSON API that provides revised wound care product recommendations. You always respond with a single, valid JSON object and nothing else."
             user_prompt = f"""
@@ -211,13 +293,11 @@ class GeminiClient(AIClientInterface):
             }}
             --- END EXAMPLE ---
             """
-            full_prompt = system_prompt + "\n\n" + user_prompt
-
-            response_text = self._make_api_call(prompt_parts=[full_prompt], max_tokens=2048, temperature=0.1)
+            # JSON mode guarantees a bare JSON body, so no fence stripping is needed before parsing.
+            response_text = self._make_api_call(prompt_parts=[system_prompt, user_prompt], max_tokens=2048, temperature=0.1, is_json=True)
             
             try:
-                cleaned_text = re.sub(r'```json\s*|\s*```', '', response_text).strip()
-                json_response = json.loads(cleaned_text)
+                json_response = json_loads(response_text)
                 return {"success": True, "revised_products_json": json_response}
             except json.JSONDecodeError:
                 return {"success": False, "error": "Failed to decode Gemini's JSON response.", "raw_response": response_text}
@@ -226,26 +306,32 @@ class GeminiClient(AIClientInterface):
             return {"success": False, "error": f"Error in Gemini revise_products: {str(e)}"}
         
 
+    def _read_pdf(self, pdf_path: str) -> bytes:
+        """Reads the healing-history PDF into memory."""
+        print(f"DEBUG: Reading PDF {pdf_path} for Gemini multimodal prompt...")
+        with open(pdf_path, "rb") as pdf_file:
+            return pdf_file.read()
+
+    def _healing_progress_parts(self, pdf_bytes: bytes) -> List:
+        """Builds the prompt parts for the healing progress request."""
+        pdf_part = {"mime_type": "application/pdf", "data": pdf_bytes}
+
+        nuanced_user_prompt = """
+        You are a world-class wound care specialist. The attached PDF file contains the complete history of a single wound.
+        Your task is to provide a nuanced 'Healing Progress Percentage' based on the LATEST image and data in the sequence.
+        Use the following definitions: 0% is the initial state, 100% is a fully healed, pale scar. A sutured wound with redness is not 100%.
+        You MUST respond with only a single, valid JSON object containing one key: 'healing_progress_percentage'.
+        """
+        
+        return [nuanced_user_prompt, pdf_part]
+
     def get_healing_progress(self, pdf_path: str) -> Dict:
         """
         Analyzes a PDF of wound history using Gemini and returns a healing percentage.
         This version correctly uses the _make_api_call helper.
         """
         try:
-            print(f"DEBUG: Reading PDF {pdf_path} for Gemini multimodal prompt...")
-            with open(pdf_path, "rb") as pdf_file:
-                pdf_bytes = pdf_file.read()
-
-            pdf_part = {"mime_type": "application/pdf", "data": pdf_bytes}
-
-            nuanced_user_prompt = """
-            You are a world-class wound care specialist. The attached PDF file contains the complete history of a single wound.
-            Your task is to provide a nuanced 'Healing Progress Percentage' based on the LATEST image and data in the sequence.
-            Use the following definitions: 0% is the initial state, 100% is a fully healed, pale scar. A sutured wound with redness is not 100%.
-            You MUST respond with only a single, valid JSON object containing one key: 'healing_progress_percentage'.
-            """
-            
-            prompt_parts = [nuanced_user_prompt, pdf_part]
+            prompt_parts = self._healing_progress_parts(self._read_pdf(pdf_path))
 
             # --- THE CRITICAL FIX ---
             # Call the robust helper function instead of calling the model directly.
@@ -258,7 +344,26 @@ class GeminiClient(AIClientInterface):
             )
             # ------------------------
             
-            json_response = json.loads(response_text)
+            json_response = json_loads(response_text)
+            return {"success": True, "healing_progress_json": json_response}
+
+        except Exception as e:
+            return {"success": False, "error": f"Error in Gemini get_healing_progress: {str(e)}"}
+
+    async def get_healing_progress_async(self, pdf_path: str) -> Dict:
+        """
+        Async version of get_healing_progress. The PDF is read in a worker thread
+        so a large history file does not stall the event loop.
+        """
+        try:
+            pdf_bytes = await asyncio.to_thread(self._read_pdf, pdf_path)
+            response_text = await self._make_api_call_async(
+                prompt_parts=self._healing_progress_parts(pdf_bytes),
+                max_tokens=1024,
+                temperature=0.0,
+                is_json=True
+            )
+            json_response = json_loads(response_text)
             return {"success": True, "healing_progress_json": json_response}
 
         except Exception as e:
@@ -1,24 +1,85 @@
+import asyncio
 import json
 import os
-import re
-from openai import OpenAI
+from openai import APITimeoutError, AsyncOpenAI, OpenAI, RateLimitError
 from dotenv import load_dotenv
 from ai_client_interface import AIClientInterface
-from typing import Dict, List
-import base64
+from response_cache import ResponseCache, make_cache_key
+from response_parser import parse_sections
+from rate_limiter import RateLimiter, estimate_tokens
+from typing import Dict, Iterator, List, Tuple
+import threading
 import time
+import httpx
 
-class GrokClient(AIClientInterface):
-    def __init__(self, api_key: str = None, model: str = "grok-4"):
-        load_dotenv()
-        self.api_key = api_key or os.getenv("XAI_API_KEY")
-        if not self.api_key:
-            raise ValueError("XAI_API_KEY not found in environment variables.")
-        
-        self.client = OpenAI(base_url="https://api.x.ai/v1", api_key=self.api_key)
-        self.model = model
-        
-        self.clinical_protocol = """
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so existing except clauses still apply.
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+# The .env file only needs to be parsed once per process, not on every GrokClient construction.
+_ENV_LOADED = False
+
+# Sampling above this temperature is meant to vary between calls, so those responses are not cached.
+_MAX_CACHEABLE_TEMPERATURE = 0.3
+
+# Published account limits used to seed the limiter, and the retry policy for transient errors.
+_RATE_LIMIT_RPM = 60
+_RATE_LIMIT_TPM = 150_000
+_MAX_ATTEMPTS = 3
+_RETRY_MIN_DELAY = 1.0
+_RETRY_MAX_DELAY = 16.0
+_RETRYABLE_ERRORS = (RateLimitError, APITimeoutError)
+
+def _retry_delay(attempt: int) -> float:
+    """Exponential backoff for the given zero-based attempt, bounded by _RETRY_MAX_DELAY."""
+    return min(_RETRY_MAX_DELAY, _RETRY_MIN_DELAY * 2 ** attempt)
+
+# Multi-image batches are split so each request stays well inside xAI's per-request size limits.
+_MAX_BATCH_CASES = 4
+_MAX_BATCH_PAYLOAD_CHARS = 20 * 1024 * 1024
+
+# HTTP/2 lets sequential calls to api.x.ai multiplex over one TLS connection; httpx needs the h2 package for it.
+try:
+    import h2  # noqa: F401
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=20)
+_HTTP_TIMEOUT = httpx.Timeout(120.0, connect=5.0)
+
+# Product revision instructions per revision reason
+_REVISION_INSTRUCTIONS = {
+    "Patient Won't Tolerate": "Focus on gentle, hypoallergenic products that are comfortable for sensitive patients.",
+    "Too Costly": "Recommend cost-effective, generic alternatives and basic wound care supplies.",
+    "Products Unavailable": "Suggest readily available alternatives that can be found in most pharmacies.",
+    "Other": "Provide alternative product recommendations with different mechanisms of action."
+}
+_DEFAULT_REVISION_INSTRUCTION = "Provide alternative product recommendations."
+
+# Server-side JSON mode: replies are a single valid JSON object with no markdown fences.
+_JSON_OBJECT_FORMAT = {"type": "json_object"}
+
+def _strip_json_fences(text: str) -> str:
+    """
+    Removes an optional markdown code fence (```json ... ```) around a JSON reply.
+    Only the ends of the string are inspected, so the cost does not grow with the response size.
+    """
+    text = text.strip()
+    if text.startswith('```'):
+        text = text[3:]
+        if text[:4].lower() == 'json':
+            text = text[4:]
+    if text.endswith('```'):
+        text = text[:-3]
+    return text.strip()
+
+# The invariant clinical protocol is always the first message, byte-for-byte identical on every call,
+# so the provider's automatic prompt-prefix caching can reuse it. Per-request data such as the
+# case date belongs in the user message only.
+_CLINICAL_PROTOCOL = """
         You are a world-class dermatologist AI. Your task is to analyze the provided wound image and clinical data.
         You MUST provide a strictly structured response with the following sections EXACTLY as named:
         **Case Information:**
@@ -89,62 +150,11 @@ class GrokClient(AIClientInterface):
 
         Base your entire analysis on the VISIBLE information in the image and the clinical data provided. Be specific. Do not invent data.
         """
+_SYSTEM_MESSAGE = {"role": "system", "content": _CLINICAL_PROTOCOL}
 
-    def _make_api_call(self, messages: List[Dict], max_tokens: int, temperature: float) -> str:
-        """A single, reliable method for making all API calls."""
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=temperature
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            error_message = f"Grok API call failed: {str(e)}"
-            print(f"CRITICAL API ERROR: {error_message}")
-            raise Exception(error_message)
-
-    def get_initial_analysis(self, prompt: str, base64_image: str) -> str:
-        """
-        Performs the primary wound analysis with an image.
-        """
-        print("DEBUG: Constructing multimodal message for Grok.")
-        messages = [
-            {
-                "role": "system",
-                "content": self.clinical_protocol
-            },
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": prompt
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}",
-                            "detail": "high"
-                        }
-                    }
-                ]
-            }
-        ]
-        
-        print("DEBUG: Sending request to Grok for image analysis...")
-        return self._make_api_call(messages=messages, max_tokens=2000, temperature=0.2)
-
-    def expand_treatment_plan(self, original_analysis: str) -> Dict:
-        """Generates an expanded treatment plan and returns it as a structured JSON object."""
-        try:
-            treatment_section_match = re.search(r'\*\*Treatment Plan:\*\*(.*?)\*\*Recommended Products:\*\*', original_analysis, re.DOTALL)
-            if not treatment_section_match:
-                return {"success": False, "error": "Could not find 'Treatment Plan' in the original analysis to expand."}
-            treatment_section = treatment_section_match.group(1).strip()
-
-            one_shot_example = """
+# Follow-up prompts are fixed templates filled with str.format_map, so everything before the
+# per-case placeholders stays byte-identical between calls.
+_EXPAND_ONE_SHOT_EXAMPLE = """
             "recommendations": [
                 {
                     "action": "Perform a focused in-person wound assessment including calibrated measurements...",
@@ -159,14 +169,14 @@ class GrokClient(AIClientInterface):
             "patient_education": "Educate the patient and caregiver on signs of infection and the importance of dressing changes."
             """
 
-            expand_prompt = f"""
+_EXPAND_PROMPT_TMPL = """
             Based on the original treatment plan below, provide a comprehensive expanded treatment plan.
             You MUST return a single, valid JSON object and nothing else. Do not include any introductory text or markdown formatting.
             The JSON object must have three keys: "recommendations" (a list of objects, each with "action" and "rationale"), "ongoing_care" (a string), and "patient_education" (a string).
 
             --- EXAMPLE of desired JSON structure ---
             {{
-            {one_shot_example}
+            """ + _EXPAND_ONE_SHOT_EXAMPLE.replace("{", "{{").replace("}", "}}") + """
             }}
             --- END EXAMPLE ---
 
@@ -175,40 +185,8 @@ class GrokClient(AIClientInterface):
             **Original Brief Treatment Plan:**
             {treatment_section}
             """
-            
-            messages = [
-                {"role": "system", "content": "You are a JSON API that provides expanded wound care treatment plans. You always respond with a single, valid JSON object and nothing else."},
-                {"role": "user", "content": expand_prompt}
-            ]
 
-            response_text = self._make_api_call(messages=messages, max_tokens=2000, temperature=0.1)
-            
-            try:
-                cleaned_text = re.sub(r'```json\s*|\s*```', '', response_text).strip()
-                json_response = json.loads(cleaned_text)
-                return {"success": True, "expanded_plan_json": json_response}
-            except json.JSONDecodeError:
-                return {"success": False, "error": "Failed to decode AI's JSON response for the expanded plan.", "raw_response": response_text}
-        
-        except Exception as e:
-            return {"success": False, "error": f"Error in Grok expand_treatment_plan: {str(e)}"}
-
-    def revise_products(self, original_analysis: str, revision_reason: str) -> Dict:
-        """Revises product recommendations and returns them as a structured JSON object."""
-        try:
-            instruction = {
-                "Patient Won't Tolerate": "Focus on gentle, hypoallergenic products that are comfortable for sensitive patients.",
-                "Too Costly": "Recommend cost-effective, generic alternatives and basic wound care supplies.",
-                "Products Unavailable": "Suggest readily available alternatives that can be found in most pharmacies.",
-                "Other": "Provide alternative product recommendations with different mechanisms of action."
-            }.get(revision_reason, "Provide alternative product recommendations.")
-
-            products_match = re.search(r'\*\*Recommended Products:\*\*(.*?)\*\*Wound Tissue Evaluation:\*\*', original_analysis, re.DOTALL)
-            if not products_match:
-                return {"success": False, "error": "Could not find 'Recommended Products' in the original analysis to revise."}
-            current_products = products_match.group(1).strip()
-
-            revision_prompt = f"""
+_REVISE_PROMPT_TMPL = """
             The current recommended products need to be revised based on the constraint: "{revision_reason}".
             
             Instruction: {instruction}
@@ -234,38 +212,394 @@ class GrokClient(AIClientInterface):
             }}
             --- END EXAMPLE ---
             """
-            
-            messages = [
-                {"role": "system", "content": "You are a JSON API that provides revised wound care product recommendations. You always respond with a single, valid JSON object and nothing else."},
-                {"role": "user", "content": revision_prompt}
-            ]
 
-            response_text = self._make_api_call(messages=messages, max_tokens=1000, temperature=0.1)
-            
+_EXPAND_SYSTEM_MESSAGE = {"role": "system", "content": "You are a JSON API that provides expanded wound care treatment plans. You always respond with a single, valid JSON object and nothing else."}
+_REVISE_SYSTEM_MESSAGE = {"role": "system", "content": "You are a JSON API that provides revised wound care product recommendations. You always respond with a single, valid JSON object and nothing else."}
+
+class GrokClient(AIClientInterface):
+    # SDK clients shared by every GrokClient with the same API key, so they share one connection pool.
+    # Async clients hold connections bound to the event loop they were first used on, so they are kept
+    # per (API key, loop): a new one is made when the running loop changes (e.g. successive asyncio.run calls).
+    _shared_clients: Dict[str, OpenAI] = {}
+    _shared_async_clients: Dict[str, tuple] = {}
+    _shared_clients_lock = threading.Lock()
+
+    @classmethod
+    def _get_shared_client(cls, api_key: str) -> OpenAI:
+        """Returns the sync client for `api_key`, creating it on first use."""
+        with cls._shared_clients_lock:
+            client = cls._shared_clients.get(api_key)
+            if client is None:
+                # Retries are handled by _create_completion so they go through the rate limiter
+                client = cls._shared_clients[api_key] = OpenAI(
+                    base_url="https://api.x.ai/v1", api_key=api_key, max_retries=0,
+                    http_client=httpx.Client(http2=_HTTP2_AVAILABLE, limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT)
+                )
+            return client
+
+    @classmethod
+    def _get_shared_async_client(cls, api_key: str) -> AsyncOpenAI:
+        """Returns the async client for `api_key` on the running event loop, creating it when the loop changes."""
+        loop = asyncio.get_running_loop()
+        with cls._shared_clients_lock:
+            entry = cls._shared_async_clients.get(api_key)
+            if entry is None or entry[0] is not loop:
+                async_client = AsyncOpenAI(
+                    base_url="https://api.x.ai/v1", api_key=api_key, max_retries=0,
+                    http_client=httpx.AsyncClient(http2=_HTTP2_AVAILABLE, limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT)
+                )
+                entry = cls._shared_async_clients[api_key] = (loop, async_client)
+            return entry[1]
+
+    @classmethod
+    async def aclose_shared_clients(cls) -> None:
+        """Closes the pooled async clients created on the running event loop; call it before the loop ends."""
+        loop = asyncio.get_running_loop()
+        with cls._shared_clients_lock:
+            closing = [(api_key, client) for api_key, (client_loop, client) in cls._shared_async_clients.items() if client_loop is loop]
+            for api_key, _ in closing:
+                del cls._shared_async_clients[api_key]
+        for _, async_client in closing:
+            await async_client.close()
+
+    @property
+    def aclient(self) -> AsyncOpenAI:
+        """The shared async client for this API key on the running event loop."""
+        return self._get_shared_async_client(self.api_key)
+
+    def __init__(self, api_key: str = None, model: str = "grok-4", healing_model: str = "grok-4-fast-non-reasoning"):
+        global _ENV_LOADED
+        if not _ENV_LOADED:
+            load_dotenv()
+            _ENV_LOADED = True
+        self.api_key = api_key or os.getenv("XAI_API_KEY")
+        if not self.api_key:
+            raise ValueError("XAI_API_KEY not found in environment variables.")
+        
+        self.client = self._get_shared_client(self.api_key)
+        self._limiter = RateLimiter(rpm=_RATE_LIMIT_RPM, tpm=_RATE_LIMIT_TPM)
+        self.model = model
+        # Healing progress is a one-integer classification, so it runs on a cheaper, faster tier
+        self.healing_model = healing_model
+        self._cache = ResponseCache(maxsize=1024, ttl=600)
+
+    def _completion_request(self, messages: List[Dict], max_tokens: int, temperature: float, response_format: Dict = None, model: str = None, stream: bool = False) -> Dict:
+        """Builds the keyword arguments for chat.completions.create; `model` defaults to self.model."""
+        request = {"model": model or self.model, "messages": messages, "max_tokens": max_tokens, "temperature": temperature}
+        if response_format is not None:
+            request["response_format"] = response_format
+        if stream:
+            request["stream"] = True
+        return request
+
+    def _create_completion(self, messages: List[Dict], max_tokens: int, temperature: float, response_format: Dict = None, model: str = None, stream: bool = False):
+        """
+        Sends one chat completion through the rate limiter, retrying rate-limit and
+        timeout errors with exponential backoff up to _MAX_ATTEMPTS times.
+        With stream=True the SDK's chunk stream is returned once the request is accepted.
+        """
+        request = self._completion_request(messages, max_tokens, temperature, response_format, model, stream)
+        estimated_tokens = estimate_tokens(messages, max_tokens)
+        for attempt in range(_MAX_ATTEMPTS):
+            self._limiter.acquire(estimated_tokens)
             try:
-                cleaned_text = re.sub(r'```json\s*|\s*```', '', response_text).strip()
-                json_response = json.loads(cleaned_text)
-                return {"success": True, "revised_products_json": json_response}
-            except json.JSONDecodeError:
-                return {"success": False, "error": "Failed to decode AI's JSON response for revised products.", "raw_response": response_text}
+                response = self.client.chat.completions.create(**request)
+            except _RETRYABLE_ERRORS as e:
+                if isinstance(e, RateLimitError):
+                    self._limiter.on_rate_limited()
+                if attempt == _MAX_ATTEMPTS - 1:
+                    raise
+                delay = _retry_delay(attempt)
+                print(f"DEBUG: Grok request throttled or timed out ({type(e).__name__}); retrying in {delay:.0f}s.")
+                time.sleep(delay)
+                continue
+            self._limiter.on_success()
+            return response
+
+    async def _create_completion_async(self, messages: List[Dict], max_tokens: int, temperature: float, response_format: Dict = None, model: str = None):
+        """Async version of _create_completion."""
+        request = self._completion_request(messages, max_tokens, temperature, response_format, model)
+        estimated_tokens = estimate_tokens(messages, max_tokens)
+        for attempt in range(_MAX_ATTEMPTS):
+            await self._limiter.acquire_async(estimated_tokens)
+            try:
+                response = await self.aclient.chat.completions.create(**request)
+            except _RETRYABLE_ERRORS as e:
+                if isinstance(e, RateLimitError):
+                    self._limiter.on_rate_limited()
+                if attempt == _MAX_ATTEMPTS - 1:
+                    raise
+                delay = _retry_delay(attempt)
+                print(f"DEBUG: Grok request throttled or timed out ({type(e).__name__}); retrying in {delay:.0f}s.")
+                await asyncio.sleep(delay)
+                continue
+            self._limiter.on_success()
+            return response
+
+    def _make_api_call(self, messages: List[Dict], max_tokens: int, temperature: float, response_format: Dict = None, model: str = None) -> str:
+        """
+        A single, reliable method for making all API calls.
+        Low-temperature requests are served from an exact-match cache when the same
+        model, messages (including any base64 image) and limits were seen recently.
+        Pass response_format={"type": "json_object"} to have the server enforce a bare JSON reply.
+        """
+        try:
+            cacheable = temperature <= _MAX_CACHEABLE_TEMPERATURE
+            if cacheable:
+                cache_key = make_cache_key(model or self.model, messages, max_tokens, temperature, response_format)
+                cached_text = self._cache.get(cache_key)
+                if cached_text is not None:
+                    print("DEBUG: Returning cached Grok response.")
+                    return cached_text
+
+            response = self._create_completion(messages, max_tokens, temperature, response_format, model)
+            response_text = response.choices[0].message.content
+            if cacheable:
+                self._cache.set(cache_key, response_text)
+            return response_text
+        except Exception as e:
+            error_message = f"Grok API call failed: {str(e)}"
+            print(f"CRITICAL API ERROR: {error_message}")
+            raise Exception(error_message)
+
+    def _make_api_call_stream(self, messages: List[Dict], max_tokens: int, temperature: float) -> Iterator[str]:
+        """
+        Streaming variant of _make_api_call: yields the reply text as it arrives.
+        It shares the exact-match cache; a cache hit is yielded as a single chunk and a
+        finished stream is stored for later calls.
+        """
+        cacheable = temperature <= _MAX_CACHEABLE_TEMPERATURE
+        if cacheable:
+            cache_key = make_cache_key(self.model, messages, max_tokens, temperature, None)
+            cached_text = self._cache.get(cache_key)
+            if cached_text is not None:
+                print("DEBUG: Returning cached Grok response.")
+                yield cached_text
+                return
+
+        parts = []
+        try:
+            for chunk in self._create_completion(messages, max_tokens, temperature, stream=True):
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if text:
+                    parts.append(text)
+                    yield text
+        except Exception as e:
+            error_message = f"Grok API call failed: {str(e)}"
+            print(f"CRITICAL API ERROR: {error_message}")
+            raise Exception(error_message)
+
+        if cacheable:
+            self._cache.set(cache_key, "".join(parts))
+
+    async def _make_api_call_async(self, messages: List[Dict], max_tokens: int, temperature: float, response_format: Dict = None, model: str = None) -> str:
+        """Async counterpart of _make_api_call, sharing the same response cache."""
+        try:
+            cacheable = temperature <= _MAX_CACHEABLE_TEMPERATURE
+            if cacheable:
+                cache_key = make_cache_key(model or self.model, messages, max_tokens, temperature, response_format)
+                cached_text = self._cache.get(cache_key)
+                if cached_text is not None:
+                    print("DEBUG: Returning cached Grok response.")
+                    return cached_text
+
+            response = await self._create_completion_async(messages, max_tokens, temperature, response_format, model)
+            response_text = response.choices[0].message.content
+            if cacheable:
+                self._cache.set(cache_key, response_text)
+            return response_text
+        except Exception as e:
+            error_message = f"Grok API call failed: {str(e)}"
+            print(f"CRITICAL API ERROR: {error_message}")
+            raise Exception(error_message)
+
+    def _initial_analysis_messages(self, prompt: str, base64_image: str) -> List[Dict]:
+        """Builds the multimodal messages for the primary wound analysis."""
+        print("DEBUG: Constructing multimodal message for Grok.")
+        return [
+            _SYSTEM_MESSAGE,
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": prompt
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{base64_image}",
+                            "detail": "high"
+                        }
+                    }
+                ]
+            }
+        ]
+
+    def get_initial_analysis(self, prompt: str, base64_image: str) -> str:
+        """
+        Performs the primary wound analysis with an image.
+        """
+        messages = self._initial_analysis_messages(prompt, base64_image)
+        print("DEBUG: Sending request to Grok for image analysis...")
+        return self._make_api_call(messages=messages, max_tokens=2000, temperature=0.2)
+
+    def get_initial_analysis_stream(self, prompt: str, base64_image: str) -> Iterator[str]:
+        """Streaming version of get_initial_analysis: yields the analysis text as it is generated."""
+        messages = self._initial_analysis_messages(prompt, base64_image)
+        print("DEBUG: Streaming request to Grok for image analysis...")
+        return self._make_api_call_stream(messages=messages, max_tokens=2000, temperature=0.2)
+
+    def get_initial_analysis_batch(self, items: List[Tuple[str, str]]) -> List[str]:
+        """
+        Analyzes several wound images with as few requests as possible.
+        Each request carries up to _MAX_BATCH_CASES cases, each tagged "### CASE i:", and the
+        model replies with a JSON array holding one full analysis per case.
+        """
+        analyses = []
+        chunk, chunk_chars = [], 0
+        for prompt, base64_image in items:
+            item_chars = len(prompt) + len(base64_image)
+            if chunk and (len(chunk) >= _MAX_BATCH_CASES or chunk_chars + item_chars > _MAX_BATCH_PAYLOAD_CHARS):
+                analyses.extend(self._analyze_batch_chunk(chunk))
+                chunk, chunk_chars = [], 0
+            chunk.append((prompt, base64_image))
+            chunk_chars += item_chars
+        if chunk:
+            analyses.extend(self._analyze_batch_chunk(chunk))
+        return analyses
+
+    def _analyze_batch_chunk(self, chunk: List[Tuple[str, str]]) -> List[str]:
+        """Sends one multi-image request and splits the reply into per-case analyses."""
+        if len(chunk) == 1:
+            return [self.get_initial_analysis(*chunk[0])]
+
+        content = [{
+            "type": "text",
+            "text": (
+                f"The following message contains {len(chunk)} separate wound cases, each introduced by '### CASE <number>:' "
+                "and followed by its image. Analyze every case independently using the required section format. "
+                f"You MUST return a single, valid JSON array of exactly {len(chunk)} strings, in case order, where each "
+                "string is the complete analysis for that case. Do not include any other text."
+            )
+        }]
+        for index, (prompt, base64_image) in enumerate(chunk, start=1):
+            content.append({"type": "text", "text": f"### CASE {index}:\n{prompt}"})
+            content.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:image/jpeg;base64,{base64_image}",
+                    "detail": "high"
+                }
+            })
+        messages = [_SYSTEM_MESSAGE, {"role": "user", "content": content}]
+
+        print(f"DEBUG: Sending batched request to Grok for {len(chunk)} images...")
+        response_text = self._make_api_call(messages=messages, max_tokens=2000 * len(chunk), temperature=0.2)
+        try:
+            analyses = json_loads(_strip_json_fences(response_text))
+        except json.JSONDecodeError:
+            raise Exception("Failed to decode Grok's JSON array for the batched analysis.")
+        if not isinstance(analyses, list) or len(analyses) != len(chunk):
+            raise Exception(f"Grok returned {len(analyses) if isinstance(analyses, list) else 'no'} analyses for {len(chunk)} cases.")
+        return [str(analysis) for analysis in analyses]
+
+    def _expand_messages(self, treatment_section: str) -> List[Dict]:
+        """Builds the chat messages for a treatment plan expansion."""
+        expand_prompt = _EXPAND_PROMPT_TMPL.format_map({"treatment_section": treatment_section})
+        return [_EXPAND_SYSTEM_MESSAGE, {"role": "user", "content": expand_prompt}]
+
+    def _revise_messages(self, revision_reason: str, current_products: str) -> List[Dict]:
+        """Builds the chat messages for a product revision."""
+        revision_prompt = _REVISE_PROMPT_TMPL.format_map({
+            "revision_reason": revision_reason,
+            "instruction": _REVISION_INSTRUCTIONS.get(revision_reason, _DEFAULT_REVISION_INSTRUCTION),
+            "current_products": current_products
+        })
+        return [_REVISE_SYSTEM_MESSAGE, {"role": "user", "content": revision_prompt}]
+
+    def _parse_follow_up(self, response_text: str, result_key: str, decode_error: str) -> Dict:
+        """Parses a follow-up JSON reply into the result dictionary expected by the facade."""
+        # JSON mode returns a bare object, so no fence stripping is needed; a reply cut off at
+        # max_tokens can still be invalid, hence the decode guard.
+        try:
+            json_response = json_loads(response_text)
+        except json.JSONDecodeError:
+            return {"success": False, "error": decode_error, "raw_response": response_text}
+
+        return {"success": True, result_key: json_response}
+
+    def expand_treatment_plan(self, original_analysis: str, treatment_section: str = None) -> Dict:
+        """
+        Generates an expanded treatment plan and returns it as a structured JSON object.
+        Pass `treatment_section` when it has already been extracted to skip re-scanning the analysis.
+        """
+        try:
+            if treatment_section is None:
+                treatment_section = parse_sections(original_analysis).get("Treatment Plan")
+                if treatment_section is None:
+                    return {"success": False, "error": "Could not find 'Treatment Plan' in the original analysis to expand."}
+
+            messages = self._expand_messages(treatment_section)
+            response_text = self._make_api_call(messages=messages, max_tokens=2000, temperature=0.1, response_format=_JSON_OBJECT_FORMAT)
+            return self._parse_follow_up(response_text, "expanded_plan_json", "Failed to decode AI's JSON response for the expanded plan.")
         
         except Exception as e:
-            return {"success": False, "error": f"Error in Grok revise_products: {str(e)}"}
+            return {"success": False, "error": f"Error in Grok expand_treatment_plan: {str(e)}"}
 
-    def get_healing_progress(self, pdf_path: str) -> Dict:
+    async def expand_treatment_plan_async(self, original_analysis: str, treatment_section: str = None) -> Dict:
+        """Async version of expand_treatment_plan using the AsyncOpenAI client."""
+        try:
+            if treatment_section is None:
+                treatment_section = parse_sections(original_analysis).get("Treatment Plan")
+                if treatment_section is None:
+                    return {"success": False, "error": "Could not find 'Treatment Plan' in the original analysis to expand."}
+
+            messages = self._expand_messages(treatment_section)
+            response_text = await self._make_api_call_async(messages=messages, max_tokens=2000, temperature=0.1, response_format=_JSON_OBJECT_FORMAT)
+            return self._parse_follow_up(response_text, "expanded_plan_json", "Failed to decode AI's JSON response for the expanded plan.")
+        
+        except Exception as e:
+            return {"success": False, "error": f"Error in Grok expand_treatment_plan: {str(e)}"}
+
+    def revise_products(self, original_analysis: str, revision_reason: str, current_products: str = None) -> Dict:
         """
-        Analyzes a PDF of wound history using Grok's multimodal capabilities (without file upload).
-        This approach reads the PDF locally and sends it directly, avoiding permission issues.
+        Revises product recommendations and returns them as a structured JSON object.
+        Pass `current_products` when it has already been extracted to skip re-scanning the analysis.
         """
         try:
-            print(f"DEBUG: Reading PDF {pdf_path} for Grok multimodal request...")
-            with open(pdf_path, "rb") as pdf_file:
-                pdf_bytes = pdf_file.read()
+            if current_products is None:
+                current_products = parse_sections(original_analysis).get("Recommended Products")
+                if current_products is None:
+                    return {"success": False, "error": "Could not find 'Recommended Products' in the original analysis to revise."}
+
+            messages = self._revise_messages(revision_reason, current_products)
+            response_text = self._make_api_call(messages=messages, max_tokens=1000, temperature=0.1, response_format=_JSON_OBJECT_FORMAT)
+            return self._parse_follow_up(response_text, "revised_products_json", "Failed to decode AI's JSON response for revised products.")
+        
+        except Exception as e:
+            return {"success": False, "error": f"Error in Grok revise_products: {str(e)}"}
+
+    async def revise_products_async(self, original_analysis: str, revision_reason: str, current_products: str = None) -> Dict:
+        """Async version of revise_products using the AsyncOpenAI client."""
+        try:
+            if current_products is None:
+                current_products = parse_sections(original_analysis).get("Recommended Products")
+                if current_products is None:
+                    return {"success": False, "error": "Could not find 'Recommended Products' in the original analysis to revise."}
 
-            # Encode PDF as base64 for the API
-            pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
+            messages = self._revise_messages(revision_reason, current_products)
+            response_text = await self._make_api_call_async(messages=messages, max_tokens=1000, temperature=0.1, response_format=_JSON_OBJECT_FORMAT)
+            return self._parse_follow_up(response_text, "revised_products_json", "Failed to decode AI's JSON response for revised products.")
+        
+        except Exception as e:
+            return {"success": False, "error": f"Error in Grok revise_products: {str(e)}"}
 
-            nuanced_user_prompt = """
+    def _healing_progress_messages(self, pdf_base64: str) -> List[Dict]:
+        """Builds the chat messages for the healing progress request."""
+        nuanced_user_prompt = """
             You are a world-class wound care specialist. The attached PDF file contains the complete history of a single wound.
             Your task is to provide a nuanced 'Healing Progress Percentage' based on the LATEST image and data in the sequence compared to previous images and data.
             
@@ -280,34 +614,58 @@ class GrokClient(AIClientInterface):
             You MUST respond with only a single, valid JSON object containing one key: 'healing_progress_percentage'.
             """
 
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": nuanced_user_prompt
-                        },
-                        {
-                            "type": "document",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "application/pdf",
-                                "data": pdf_base64
-                            }
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": nuanced_user_prompt
+                    },
+                    {
+                        "type": "document",
+                        "source": {
+                            "type": "base64",
+                            "media_type": "application/pdf",
+                            "data": pdf_base64
                         }
-                    ]
-                }
-            ]
+                    }
+                ]
+            }
+        ]
+
+    def get_healing_progress(self, pdf_path: str) -> Dict:
+        """
+        Analyzes a PDF of wound history using Grok's multimodal capabilities (without file upload).
+        This approach reads the PDF locally and sends it directly, avoiding permission issues.
+        """
+        try:
+            messages = self._healing_progress_messages(self.encode_pdf(pdf_path))
 
             print("DEBUG: Sending request to Grok for healing progress analysis...")
-            response_text = self._make_api_call(messages=messages, max_tokens=1024, temperature=0.0)
-            
-            # Clean and parse JSON response
-            cleaned_text = re.sub(r'```json\s*|\s*```', '', response_text).strip()
-            json_response = json.loads(cleaned_text)
+            # The reply is a single tiny JSON object, so a small completion budget is enough
+            response_text = self._make_api_call(messages=messages, max_tokens=24, temperature=0.0, response_format=_JSON_OBJECT_FORMAT, model=self.healing_model)
+            json_response = json_loads(response_text)
             
             return {"success": True, "healing_progress_json": json_response}
 
+        except Exception as e:
+            return {"success": False, "error": f"Error in Grok get_healing_progress: {str(e)}"}
+
+    async def get_healing_progress_async(self, pdf_path: str) -> Dict:
+        """
+        Async version of get_healing_progress. The PDF is read and encoded in a worker thread,
+        so the file I/O never blocks the event loop, and the request itself is sent natively async.
+        """
+        try:
+            pdf_base64 = await asyncio.to_thread(self.encode_pdf, pdf_path)
+            messages = self._healing_progress_messages(pdf_base64)
+
+            print("DEBUG: Sending async request to Grok for healing progress analysis...")
+            response_text = await self._make_api_call_async(messages=messages, max_tokens=24, temperature=0.0, response_format=_JSON_OBJECT_FORMAT, model=self.healing_model)
+            json_response = json_loads(response_text)
+
+            return {"success": True, "healing_progress_json": json_response}
+
         except Exception as e:
             return {"success": False, "error": f"Error in Grok get_healing_progress: {str(e)}"}
\ No newline at end of file
@@ -1,19 +1,55 @@
+import asyncio
 import json
+from concurrent.futures import Executor, ThreadPoolExecutor
 from client_factory import get_ai_client
 from data_formatter import ClinicalDataFormatter
-from response_parser import AIResponseParser
+from response_parser import AIResponseParser, parse_sections
 from datetime import datetime
 from pdf_generator import create_healing_history_pdf
+from response_cache import ResponseCache, make_cache_key
 import os
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Revision reasons accepted by the product revision follow-ups
+_VALID_REVISION_REASONS = frozenset({"Patient Won't Tolerate", "Too Costly", "Products Unavailable", "Other"})
+
+def _pretty_json(data) -> str:
+    """Formats JSON for console output with 2-space indentation, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(data, indent=2)
+
 class NurseLensFacade:
-    def __init__(self, model_name: str):
-        """Initializes the coordinator."""
-        self.client = get_ai_client(model_name)
+    def __init__(self, model_name: str, remember_last_analysis: bool = True, client_options: dict = None):
+        """
+        Initializes the coordinator.
+        With remember_last_analysis=False (a facade shared across requests) analyses are not
+        stored on the instance, so every follow-up must be given its `original_analysis`.
+        `client_options` are passed to the AI client's constructor, e.g.
+        {"use_file_uploads": True} to send OpenAI images by Files API file_id.
+        """
+        self.client = get_ai_client(model_name, **(client_options or {}))
         self.formatter = ClinicalDataFormatter()
         self.parser = AIResponseParser()
+        self.remember_last_analysis = remember_last_analysis
         self.last_analysis = None
         self.last_assessment_data = None
+        # Successful analyses keyed by image identity and inputs, so identical re-submissions (e.g. retries) skip
+        # the whole workflow. Shared facades skip it: the API already caches its responses for the same window.
+        self._analysis_cache = ResponseCache(maxsize=64, ttl=300) if remember_last_analysis else None
+
+    def _envelope(self, success: bool, now: datetime = None, model_name: str = None, **fields) -> dict:
+        """Builds a facade response with the shared success/timestamp/model_used fields, followed by `fields`."""
+        return {
+            "success": success,
+            "timestamp": (now or datetime.now()).isoformat(),
+            "model_used": model_name or self.client.model,
+            **fields
+        }
 
     def calculate_healing_progress(self, patient_id: str, history_records: list) -> dict:
         """
@@ -26,13 +62,11 @@ class NurseLensFacade:
         if len(history_records) < 2:
             print("DEBUG: Less than 2 assessments found. Healing progress is 0%.")
             # Return a consistent JSON response structure
-            return {
-                "success": True,
-                "timestamp": datetime.now().isoformat(),
-                "model_used": self.client.model,
-                "pdf_path": None,  # No PDF generated for single record
-                "json_response": {"healing_progress_percentage": 0}
-            }
+            return self._envelope(
+                True,
+                pdf_path=None,  # No PDF generated for single record
+                json_response={"healing_progress_percentage": 0}
+            )
         
         pdf_path = None  # Initialize to ensure it exists
         try:
@@ -50,92 +84,311 @@ class NurseLensFacade:
                 return result
 
             # Build the final, consistent API response
-            return {
-                "success": True,
-                "timestamp": datetime.now().isoformat(),
-                "model_used": self.client.model,
-                "pdf_path": pdf_path,  # Optionally return the path for reference
-                "json_response": result["healing_progress_json"]
-            }
+            return self._envelope(
+                True,
+                pdf_path=pdf_path,  # Optionally return the path for reference
+                json_response=result["healing_progress_json"]
+            )
         except Exception as e:
             # If an error occurs, we still have the pdf_path if it was created
-            error_response = {
-                "success": False,
-                "timestamp": datetime.now().isoformat(),  # Added for consistency
-                "model_used": self.client.model,  # Added for consistency
-                "error": f"Healing progress workflow failed: {str(e)}"
-            }
+            error_response = self._envelope(False, error=f"Healing progress workflow failed: {str(e)}")
             if pdf_path:
                 error_response["pdf_path"] = pdf_path
             return error_response
 
-    def analyze_wound_with_image(self, image_path: str, wound_location: str = "Right Arm", **assessment_params) -> dict:
-        """Orchestrates the end-to-end wound analysis process using a single, powerful API call."""
+    async def calculate_healing_progress_async(self, patient_id: str, history_records: list, pdf_executor: Executor = None) -> dict:
+        """
+        Async version of calculate_healing_progress. The CPU-bound PDF build runs in a worker
+        thread (on `pdf_executor` if given, else the loop's default executor), so other
+        coroutines (other patients, other steps) keep dispatching API calls meanwhile.
+        """
+        print(f"\nDEBUG: Starting healing progress calculation for patient {patient_id}...")
+
+        if len(history_records) < 2:
+            print("DEBUG: Less than 2 assessments found. Healing progress is 0%.")
+            return self._envelope(True, pdf_path=None, json_response={"healing_progress_percentage": 0})
+
+        pdf_path = None
         try:
-            assessment_data = self.formatter.format_assessment_data(**assessment_params)
-            current_date = datetime.now().strftime("%d/%m/%Y")
-            main_prompt = self.formatter.create_main_analysis_prompt(assessment_data, wound_location, current_date)
-            base64_image = self.client.encode_image(image_path)
-            
-            print("DEBUG: Making a single, comprehensive API call for all sections...")
-            complete_ai_analysis = self.client.get_initial_analysis(main_prompt, base64_image)
+            loop = asyncio.get_running_loop()
+            pdf_path = await loop.run_in_executor(pdf_executor, create_healing_history_pdf, history_records, patient_id)
+            result = await self.client.get_healing_progress_async(pdf_path)
+
+            if not result["success"]:
+                return result
+
+            return self._envelope(True, pdf_path=pdf_path, json_response=result["healing_progress_json"])
+        except Exception as e:
+            error_response = self._envelope(False, error=f"Healing progress workflow failed: {str(e)}")
+            if pdf_path:
+                error_response["pdf_path"] = pdf_path
+            return error_response
 
+    async def calculate_healing_progress_batch(self, patient_to_history: dict) -> dict:
+        """
+        Calculates healing progress for many patients at once. PDFs are built on a thread pool
+        sized to the CPU count, and each patient's API call is sent as soon as its PDF is ready.
+        Returns {patient_id: result}, with each result shaped like calculate_healing_progress's.
+        """
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as pdf_executor:
+            results = await asyncio.gather(*(
+                self.calculate_healing_progress_async(patient_id, history_records, pdf_executor)
+                for patient_id, history_records in patient_to_history.items()
+            ))
+        return dict(zip(patient_to_history, results))
+
+    def _collect_stream(self, chunks) -> str:
+        """Joins streamed analysis chunks into the full text, echoing them to stdout as they arrive."""
+        parts = []
+        for chunk in chunks:
+            print(chunk, end="", flush=True)
+            parts.append(chunk)
+        print()
+        return "".join(parts)
+
+    def _analysis_key(self, image_path: str, image_bytes: bytes, wound_location: str, current_date: str, assessment_params: dict) -> bytes:
+        """
+        Identifies an analysis request by its image (path plus size and mtime, or the raw bytes),
+        its inputs and the date written into the prompt.
+        Returns None when the image file cannot be read, leaving the error to the client's encoder,
+        or when this facade keeps no analysis cache.
+        """
+        if self._analysis_cache is None:
+            return None
+        if image_bytes is not None:
+            image_identity = image_bytes
+        else:
+            try:
+                st = os.stat(image_path)
+            except (OSError, TypeError):
+                return None
+            image_identity = (image_path, st.st_size, st.st_mtime_ns)
+        return make_cache_key(image_identity, wound_location, current_date, assessment_params)
+
+    def _use_cached_analysis(self, cache_key: bytes):
+        """Makes a cached analysis the last analysis again and returns its response, or None on a miss."""
+        response = self._analysis_cache.get(cache_key) if cache_key is not None else None
+        if response is None:
+            return None
+        print("DEBUG: Identical assessment already analyzed this session; returning the cached result.")
+        # Only facades that remember their last analysis keep a cache, so this never touches shared state
+        self.last_analysis, self.last_assessment_data = response["analysis_text"], response["assessment_data"]
+        return response
+
+    def _finish_analysis(self, complete_ai_analysis: str, assessment_data: dict, now: datetime, model_name: str, cache_key: bytes = None) -> dict:
+        """Stores the analysis for follow-ups (unless this facade is shared) and builds the structured API response."""
+        if self.remember_last_analysis:
             self.last_analysis = complete_ai_analysis
             self.last_assessment_data = assessment_data
 
-            response_json = self.parser.parse_response_to_json(complete_ai_analysis)
+        response_json = self.parser.parse_response_to_json(complete_ai_analysis)
 
-            return {
-                "success": True, "timestamp": datetime.now().isoformat(),
-                "model_used": self.client.model, "assessment_data": assessment_data,
-                "json_response": response_json,
-            }
-        except Exception as e:
+        # analysis_text is the raw text the follow-ups (and the follow-up endpoints) take as original_analysis
+        response = self._envelope(True, now, model_name, assessment_data=assessment_data, json_response=response_json, analysis_text=complete_ai_analysis)
+        if cache_key is not None:
+            self._analysis_cache.set(cache_key, response)
+        return response
+
+    def _analysis_failed(self, e: Exception) -> dict:
+        if self.remember_last_analysis:
             self.last_analysis = None
             self.last_assessment_data = None
-            return {"success": False, "error": f"Workflow error: {str(e)}"}
+        return {"success": False, "error": f"Workflow error: {str(e)}"}
+
+    def analyze_wound_with_image(self, image_path: str = None, wound_location: str = "Right Arm", image_bytes: bytes = None, stream: bool = False, **assessment_params) -> dict:
+        """
+        Orchestrates the end-to-end wound analysis process using a single, powerful API call.
+        The image can be given either as a file path or as raw bytes (e.g. an uploaded file).
+        With stream=True the analysis is printed as it is generated.
+        """
+        try:
+            # One clock read and model lookup serve the prompt date, the assessment data and the response envelope
+            now = datetime.now()
+            model_name = self.client.model
+            assessment_data = self.formatter.format_assessment_data(now=now, **assessment_params)
+            current_date = now.strftime("%d/%m/%Y")
+            cache_key = self._analysis_key(image_path, image_bytes, wound_location, current_date, assessment_params)
+            cached_response = self._use_cached_analysis(cache_key)
+            if cached_response is not None:
+                return cached_response
+            main_prompt = self.formatter.create_main_analysis_prompt(assessment_data, wound_location, current_date)
+            
+            print("DEBUG: Making a single, comprehensive API call for all sections...")
+            if image_bytes is not None and not stream:
+                complete_ai_analysis = self.client.get_initial_analysis_bytes(main_prompt, image_bytes)
+            else:
+                if image_bytes is not None:
+                    base64_image = self.client.encode_image_bytes(image_bytes)
+                else:
+                    base64_image = self.client.encode_image(image_path)
+
+                if stream:
+                    complete_ai_analysis = self._collect_stream(self.client.get_initial_analysis_stream(main_prompt, base64_image))
+                else:
+                    complete_ai_analysis = self.client.get_initial_analysis(main_prompt, base64_image)
+
+            return self._finish_analysis(complete_ai_analysis, assessment_data, now, model_name, cache_key)
+        except Exception as e:
+            return self._analysis_failed(e)
 
-    def expand_last_treatment_plan(self) -> dict:
+    async def analyze_wound_with_image_async(self, image_path: str = None, wound_location: str = "Right Arm", image_bytes: bytes = None, **assessment_params) -> dict:
+        """
+        Async version of analyze_wound_with_image, so several assessments can be in flight at once.
+        The analysis stored for follow-ups is that of whichever call finishes last, so concurrent
+        callers should pass the response's analysis_text to the follow-ups instead.
+        """
+        try:
+            now = datetime.now()
+            model_name = self.client.model
+            assessment_data = self.formatter.format_assessment_data(now=now, **assessment_params)
+            current_date = now.strftime("%d/%m/%Y")
+            cache_key = self._analysis_key(image_path, image_bytes, wound_location, current_date, assessment_params)
+            cached_response = self._use_cached_analysis(cache_key)
+            if cached_response is not None:
+                return cached_response
+            main_prompt = self.formatter.create_main_analysis_prompt(assessment_data, wound_location, current_date)
+
+            print("DEBUG: Making a single, comprehensive async API call for all sections...")
+            if image_bytes is not None:
+                complete_ai_analysis = await self.client.get_initial_analysis_bytes_async(main_prompt, image_bytes)
+            else:
+                base64_image = await asyncio.to_thread(self.client.encode_image, image_path)
+                complete_ai_analysis = await self.client.get_initial_analysis_async(main_prompt, base64_image)
+
+            return self._finish_analysis(complete_ai_analysis, assessment_data, now, model_name, cache_key)
+        except Exception as e:
+            return self._analysis_failed(e)
+
+    def expand_last_treatment_plan(self, original_analysis: str = None) -> dict:
         """
         Expands the treatment plan and returns a full, structured API response.
+        Uses `original_analysis` when given, otherwise the last analysis run on this facade.
         """
-        if not self.last_analysis:
+        original_analysis = original_analysis or self.last_analysis
+        if not original_analysis:
             return {"success": False, "error": "You must run 'analyze_wound_with_image' first."}
         
         print("\nDEBUG: Calling client to expand treatment plan...")
-        result = self.client.expand_treatment_plan(self.last_analysis)
+        result = self.client.expand_treatment_plan(original_analysis, parse_sections(original_analysis).get("Treatment Plan"))
 
         if not result["success"]:
             return result
 
-        return {
-            "success": True,
-            "timestamp": datetime.now().isoformat(),
-            "model_used": self.client.model,
-            "json_response": result["expanded_plan_json"]
-        }
+        return self._envelope(True, json_response=result["expanded_plan_json"])
 
-    def revise_last_products(self, revision_reason: str) -> dict:
+    def revise_last_products(self, revision_reason: str, original_analysis: str = None) -> dict:
         """
         Revises products and returns a full, structured API response.
+        Uses `original_analysis` when given, otherwise the last analysis run on this facade.
         """
-        if not self.last_analysis:
+        original_analysis = original_analysis or self.last_analysis
+        if not original_analysis:
             return {"success": False, "error": "You must run 'analyze_wound_with_image' first."}
         
-        if revision_reason not in ["Patient Won't Tolerate", "Too Costly", "Products Unavailable", "Other"]:
+        if revision_reason not in _VALID_REVISION_REASONS:
             return {"success": False, "error": "Invalid revision reason."}
             
         print(f"\nDEBUG: Calling client to revise products (Reason: {revision_reason})...")
-        result = self.client.revise_products(self.last_analysis, revision_reason)
+        result = self.client.revise_products(original_analysis, revision_reason, parse_sections(original_analysis).get("Recommended Products"))
+
+        if not result["success"]:
+            return result
+
+        return self._envelope(True, json_response=result["revised_products_json"])
+
+    async def expand_last_treatment_plan_async(self, original_analysis: str = None) -> dict:
+        """Async version of expand_last_treatment_plan, so it can run alongside other follow-ups."""
+        original_analysis = original_analysis or self.last_analysis
+        if not original_analysis:
+            return {"success": False, "error": "You must run 'analyze_wound_with_image' first."}
+        
+        print("\nDEBUG: Calling client to expand treatment plan (async)...")
+        result = await self.client.expand_treatment_plan_async(original_analysis, parse_sections(original_analysis).get("Treatment Plan"))
+
+        if not result["success"]:
+            return result
+
+        return self._envelope(True, json_response=result["expanded_plan_json"])
+
+    async def revise_last_products_async(self, revision_reason: str, original_analysis: str = None) -> dict:
+        """Async version of revise_last_products, so it can run alongside other follow-ups."""
+        original_analysis = original_analysis or self.last_analysis
+        if not original_analysis:
+            return {"success": False, "error": "You must run 'analyze_wound_with_image' first."}
+        
+        if revision_reason not in _VALID_REVISION_REASONS:
+            return {"success": False, "error": "Invalid revision reason."}
+            
+        print(f"\nDEBUG: Calling client to revise products (async, Reason: {revision_reason})...")
+        result = await self.client.revise_products_async(original_analysis, revision_reason, parse_sections(original_analysis).get("Recommended Products"))
 
         if not result["success"]:
             return result
 
+        return self._envelope(True, json_response=result["revised_products_json"])
+
+    def _follow_up_response(self, result: dict, result_key: str) -> dict:
+        """Wraps a successful client follow-up result in the facade response envelope."""
+        if not result["success"]:
+            return result
+        return self._envelope(True, json_response=result[result_key])
+
+    async def run_follow_ups_async(self, revision_reason: str, original_analysis: str = None) -> tuple:
+        """
+        Runs the treatment plan expansion and the product revision together. Both only read
+        the analysis text, so the client may send them concurrently or as one combined request.
+        Returns (expand_result, revise_result).
+        """
+        original_analysis = original_analysis or self.last_analysis
+        if not original_analysis or revision_reason not in _VALID_REVISION_REASONS:
+            # Let the individual methods report the problem
+            return await asyncio.gather(
+                self.expand_last_treatment_plan_async(original_analysis),
+                self.revise_last_products_async(revision_reason, original_analysis)
+            )
+
+        print(f"\nDEBUG: Calling client to expand treatment plan and revise products (async, Reason: {revision_reason})...")
+        sections = parse_sections(original_analysis)
+        expand_result, revise_result = await self.client.expand_and_revise_async(
+            original_analysis, revision_reason, sections.get("Treatment Plan"), sections.get("Recommended Products")
+        )
+        return (
+            self._follow_up_response(expand_result, "expanded_plan_json"),
+            self._follow_up_response(revise_result, "revised_products_json")
+        )
+
+    async def analyze_with_follow_ups_async(self, revision_reason: str, image_path: str = None, wound_location: str = "Right Arm", image_bytes: bytes = None, **assessment_params) -> dict:
+        """
+        Runs the initial analysis and then the treatment plan expansion and product revision
+        concurrently. The follow-ups need the analysis text, so only they run side by side.
+        Returns {"analysis": ..., "expanded_plan": ..., "revised_products": ...}; the follow-ups
+        are None when the analysis fails.
+        """
+        analysis_result = await self.analyze_wound_with_image_async(image_path, wound_location, image_bytes, **assessment_params)
+        if not analysis_result["success"]:
+            return {"analysis": analysis_result, "expanded_plan": None, "revised_products": None}
+
+        expand_result, revise_result = await self.run_follow_ups_async(revision_reason, analysis_result["analysis_text"])
+        return {"analysis": analysis_result, "expanded_plan": expand_result, "revised_products": revise_result}
+
+    async def finalize_last_analysis(self, revision_reason: str, patient_id: str = None, history_records: list = None, original_analysis: str = None) -> dict:
+        """
+        Runs every follow-up of `original_analysis` (default: the last analysis) in one asyncio.gather:
+        the treatment plan expansion, the product revision and, when a history is given, the healing progress.
+        Rate limiting is left to the clients, which already throttle their outbound calls.
+        Returns {"expanded_plan": ..., "revised_products": ..., "healing_progress": ... or None}.
+        """
+        follow_ups_task = asyncio.create_task(self.run_follow_ups_async(revision_reason, original_analysis or self.last_analysis))
+        tasks = [follow_ups_task]
+        if history_records is not None:
+            tasks.append(asyncio.create_task(self.calculate_healing_progress_async(patient_id, history_records)))
+
+        results = await asyncio.gather(*tasks)
+        expand_result, revise_result = results[0]
         return {
-            "success": True,
-            "timestamp": datetime.now().isoformat(),
-            "model_used": self.client.model,
-            "json_response": result["revised_products_json"]
+            "expanded_plan": expand_result,
+            "revised_products": revise_result,
+            "healing_progress": results[1] if history_records is not None else None
         }
 
 if __name__ == "__main__":
@@ -148,72 +401,95 @@ if __name__ == "__main__":
     
     simulated_backend_database = []
 
-    # --- STEP 1: FIRST ASSESSMENT (DAY 0 - Open Wound) ---
-    print("\n" + "="*20 + " ASSESSMENT 1 (DAY 0) " + "="*20)
-    initial_result = ai_system.analyze_wound_with_image(
-        image_path="wound_1.png",
-        wound_location="Volar Wrist/Palm",
-        other_information="Initial assessment of an open abrasion on the hand."
-    )
-    if initial_result["success"]:
-        record1 = {
+    # The three assessments are independent, so they run concurrently (at most 5 in flight);
+    # results are stored back in their original order.
+    assessments = [
+        {
+            "label": "ASSESSMENT 1 (DAY 0)",
             "image_path": "wound_1.png",
             "assessment_date": "2025-10-01 09:00:00",
-            "analysis": initial_result["json_response"]
-        }
-        simulated_backend_database.append(record1)
-        print("Assessment 1 successful. Data stored in backend.")
-    else:
-        print(f"Assessment 1 failed: {initial_result['error']}")
-
-    # --- STEP 2: SECOND ASSESSMENT (DAY 10 - Stitches) ---
-    print("\n" + "="*20 + " ASSESSMENT 2 (DAY 10) " + "="*20)
-    reassessment_1 = ai_system.analyze_wound_with_image(
-        image_path="wound_2.png",
-        wound_location="Volar Wrist/Palm",
-        other_information="Reassessment after primary closure with sutures. Wound edges are approximated."
-    )
-    if reassessment_1["success"]:
-        record2 = {
+            "other_information": "Initial assessment of an open abrasion on the hand."
+        },
+        {
+            "label": "ASSESSMENT 2 (DAY 10)",
             "image_path": "wound_2.png",
             "assessment_date": "2025-10-11 09:30:00", # 10 days later
-            "analysis": reassessment_1["json_response"]
-        }
-        simulated_backend_database.append(record2)
-        print("Assessment 2 successful. Data stored in backend.")
-    else:
-        print(f"Assessment 2 failed: {reassessment_1['error']}")
-
-    # --- STEP 3: THIRD ASSESSMENT (DAY 30 - Healed Scar) ---
-    print("\n" + "="*20 + " ASSESSMENT 3 (DAY 30) " + "="*20)
-    reassessment_2 = ai_system.analyze_wound_with_image(
-        image_path="wound_3.png",
-        wound_location="Volar Wrist/Palm",
-        other_information="Final follow-up. Sutures removed, wound is fully epithelialized, leaving a mature scar."
-    )
-    if reassessment_2["success"]:
-        record3 = {
+            "other_information": "Reassessment after primary closure with sutures. Wound edges are approximated."
+        },
+        {
+            "label": "ASSESSMENT 3 (DAY 30)",
             "image_path": "wound_3.png",
             "assessment_date": "2025-10-31 10:00:00", # 20 days after the second assessment
-            "analysis": reassessment_2["json_response"]
-        }
-        simulated_backend_database.append(record3)
-        print("Assessment 3 successful. Data stored in backend.")
-    else:
-        print(f"Assessment 3 failed: {reassessment_2['error']}")
+            "other_information": "Final follow-up. Sutures removed, wound is fully epithelialized, leaving a mature scar."
+        },
+    ]
 
-    # --- STEP 2: CALCULATING HEALING PROGRESS ---
-    print("\n" + "="*20 + " CALCULATING HEALING PROGRESS " + "="*20)
-    
-    progress_result = ai_system.calculate_healing_progress(
-        patient_id=patient_id, 
-        history_records=simulated_backend_database
-    )
+    # Everything async runs on one event loop: the pooled async HTTP clients keep connections bound
+    # to the loop that opened them, so a second asyncio.run would find them tied to a closed loop.
+    async def main(max_concurrency: int = 5) -> tuple:
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run_one(assessment: dict) -> dict:
+            async with semaphore:
+                return await ai_system.analyze_wound_with_image_async(
+                    image_path=assessment["image_path"],
+                    wound_location="Volar Wrist/Palm",
+                    other_information=assessment["other_information"]
+                )
+
+        print("\n" + "="*20 + " ASSESSMENTS 1-3 (CONCURRENT) " + "="*20)
+        assessment_results = await asyncio.gather(*(run_one(assessment) for assessment in assessments))
+
+        # The follow-ups run on the latest assessment in date order, not on whichever call finished last
+        latest_analysis = None
+        for index, (assessment, result) in enumerate(zip(assessments, assessment_results), start=1):
+            print("\n" + "="*20 + f" {assessment['label']} " + "="*20)
+            if result["success"]:
+                simulated_backend_database.append({
+                    "image_path": assessment["image_path"],
+                    "assessment_date": assessment["assessment_date"],
+                    "analysis": result["json_response"]
+                })
+                latest_analysis = result["analysis_text"]
+                print(f"Assessment {index} successful. Data stored in backend.")
+            else:
+                print(f"Assessment {index} failed: {result['error']}")
+
+        # --- STEP 2: FOLLOW-UPS (EXPAND + REVISE) AND HEALING PROGRESS, ALL CONCURRENTLY ---
+        print("\n" + "="*20 + " FOLLOW-UPS AND HEALING PROGRESS " + "="*20)
+
+        try:
+            final_results = await ai_system.finalize_last_analysis(
+                revision_reason="Too Costly",
+                patient_id=patient_id,
+                history_records=simulated_backend_database,
+                original_analysis=latest_analysis
+            )
+        finally:
+            # Close the pooled async connections while their loop is still running
+            aclose_shared_clients = getattr(ai_system.client, "aclose_shared_clients", None)
+            if aclose_shared_clients is not None:
+                await aclose_shared_clients()
+        return latest_analysis, final_results
+
+    latest_analysis, final_results = asyncio.run(main())
+
+    if latest_analysis:
+        follow_ups = (("EXPANDED TREATMENT PLAN", final_results["expanded_plan"]), ("REVISED PRODUCTS", final_results["revised_products"]))
+        for label, follow_up in follow_ups:
+            if follow_up["success"]:
+                print(f"\n--- {label} (JSON) ---")
+                print(_pretty_json(follow_up["json_response"]))
+            else:
+                print(f"\n--- {label} FAILED ---")
+                print(f"Error: {follow_up.get('error', 'Unknown error')}")
+
+    progress_result = final_results["healing_progress"]
 
     if progress_result["success"]:
         print("\n--- HEALING PROGRESS RESULT (JSON) ---")
         progress_json = progress_result['json_response']
-        print(json.dumps(progress_json, indent=2))
+        print(_pretty_json(progress_json))
         percentage = progress_json.get("healing_progress_percentage", "N/A")
         print(f"\n>>>>>> Overall Healing Progress: {percentage}% <<<<<<")
         if progress_result.get('pdf_path'):
@@ -1,26 +1,169 @@
+import asyncio
+import atexit
 import json
 import os
-import re # Make sure re is imported
-from openai import OpenAI
+import ssl
+from openai import APIConnectionError, APITimeoutError, AsyncOpenAI, InternalServerError, OpenAI, RateLimitError
 from dotenv import load_dotenv
 from ai_client_interface import AIClientInterface
-from typing import Dict, List
-import base64
+from response_cache import ResponseCache, make_cache_key
+from response_parser import extract_json, parse_sections
+from typing import Callable, Dict, Iterator, List
+import random
+import threading
 import time
+import httpx
+from concurrent.futures import ThreadPoolExecutor
+
+# HTTP/2 lets concurrent calls to api.openai.com multiplex over one TLS connection; httpx needs the h2 package for it.
+try:
+    import h2  # noqa: F401
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=100)
+_HTTP_TIMEOUT = httpx.Timeout(120.0, connect=5.0)
+# Loading the CA bundle is the slow part of building an HTTPS client, so it is done once per process
+_SSL_CONTEXT = ssl.create_default_context()
+
+# Product revision instructions per revision reason
+_REVISION_INSTRUCTIONS = {
+    "Patient Won't Tolerate": "Focus on gentle, hypoallergenic products that are comfortable for sensitive patients.",
+    "Too Costly": "Recommend cost-effective, generic alternatives and basic wound care supplies.",
+    "Products Unavailable": "Suggest readily available alternatives that can be found in most pharmacies.",
+    "Other": "Provide alternative product recommendations with different mechanisms of action."
+}
+_DEFAULT_REVISION_INSTRUCTION = "Provide alternative product recommendations."
+
+# Follow-up prompts are fixed templates filled with str.format_map, with the per-case
+# text at the end so everything before it stays byte-identical between calls.
+_EXPAND_ONE_SHOT_EXAMPLE = """
+            "recommendations": [
+                {
+                    "action": "Perform a focused in-person wound assessment including calibrated measurements...",
+                    "rationale": "Accurate characterization and microbiology are necessary to direct appropriate therapy."
+                },
+                {
+                    "action": "Irrigate the wound with sterile 0.9% saline...",
+                    "rationale": "Mechanical irrigation reduces surface bioburden and aids assessment while preserving viable tissue."
+                }
+            ],
+            "ongoing_care": "Change dressings every 48–72 hours or sooner if saturated... Escalate to urgent evaluation if any of the following occur: ...",
+            "patient_education": "Educate the patient and caregiver on signs of infection and the importance of dressing changes."
+            """
 
-class OpenAIClient(AIClientInterface):
-    # ... (__init__ and clinical_protocol are fine)
-    def __init__(self, api_key: str = None, model: str = "gpt-4o"):
-        load_dotenv()
-        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
-        if not self.api_key:
-            raise ValueError("OPENAI_API_KEY not found in environment variables.")
-        
-        self.client = OpenAI(api_key=self.api_key)
-        self.model = model
-        # In the OpenAIClient class, inside the __init__ method:
+_EXPAND_PROMPT_TMPL = """
+            Based on the original treatment plan below, provide a comprehensive expanded treatment plan.
+            You MUST return a single, valid JSON object and nothing else. Do not include any introductory text or markdown formatting.
+            The JSON object must have three keys: "recommendations" (a list of objects, each with "action" and "rationale"), "ongoing_care" (a string), and "patient_education" (a string).
+
+            --- EXAMPLE of desired JSON structure ---
+            {{
+            """ + _EXPAND_ONE_SHOT_EXAMPLE.replace("{", "{{").replace("}", "}}") + """
+            }}
+            --- END EXAMPLE ---
+
+            Now, generate the JSON for the following case:
+
+            **Original Brief Treatment Plan:**
+            {treatment_section}
+            """
 
-        self.clinical_protocol = """
+_REVISE_PROMPT_TMPL = """
+            The current recommended products need to be revised based on the constraint: "{revision_reason}".
+            
+            Instruction: {instruction}
+            
+            Current Recommended Products:
+            {current_products}
+            
+            You MUST return a single, valid JSON object and nothing else.
+            The JSON object must have one key: "revised_products", which is a list of objects. Each object should have two keys: "product_name" and "rationale".
+
+            --- EXAMPLE of desired JSON structure ---
+            {{
+              "revised_products": [
+                {{
+                  "product_name": "Generic Sterile Saline (0.9%)",
+                  "rationale": "A cost-effective alternative for wound cleansing that is widely available."
+                }},
+                {{
+                  "product_name": "Basic Non-adherent Gauze",
+                  "rationale": "Provides a budget-friendly primary dressing to protect the wound bed."
+                }}
+              ]
+            }}
+            --- END EXAMPLE ---
+            """
+
+_EXPAND_SYSTEM_MESSAGE = {"role": "system", "content": "You are a JSON API that provides expanded wound care treatment plans. You always respond with a single, valid JSON object and nothing else."}
+_REVISE_SYSTEM_MESSAGE = {"role": "system", "content": "You are a JSON API that provides revised wound care product recommendations. You always respond with a single, valid JSON object and nothing else."}
+
+# Both follow-ups packed into one request: each task keeps its own prompt, and the reply nests both answers
+_COMBINED_SYSTEM_MESSAGE = {"role": "system", "content": "You are a JSON API that provides expanded wound care treatment plans and revised wound care product recommendations. You always respond with a single, valid JSON object and nothing else."}
+_COMBINED_PROMPT_TMPL = """
+            Complete the two independent tasks below.
+            You MUST return a single, valid JSON object and nothing else, with exactly two keys:
+            "expanded_plan" (the JSON object requested by TASK 1) and "product_revision" (the JSON object requested by TASK 2).
+
+            ### TASK 1 ###
+            {expand_prompt}
+
+            ### TASK 2 ###
+            {revise_prompt}
+            """
+
+# Transient failures worth retrying; anything else (e.g. a BadRequestError) fails immediately.
+_RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+_MAX_ATTEMPTS = 3
+_MAX_RETRY_DELAY = 30.0
+
+def _retry_delay(attempt: int, error: Exception = None) -> float:
+    """
+    Seconds to wait before retrying after `error` on the given zero-based attempt: the server's
+    Retry-After hint when it sends one, else exponential backoff with up to one second of jitter.
+    Either way the wait is capped at _MAX_RETRY_DELAY.
+    """
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        delay = float(retry_after)
+    except (TypeError, ValueError):
+        delay = 2 ** attempt + random.random()
+    return min(max(delay, 0.0), _MAX_RETRY_DELAY)
+
+# Batch API jobs: non-real-time analyses at half price, polled with backoff until they settle
+_BATCH_ENDPOINT = "/v1/chat/completions"
+_BATCH_PENDING_STATUSES = ("validating", "in_progress", "finalizing", "cancelling")
+_BATCH_POLL_MIN_DELAY = 5.0
+_BATCH_POLL_MAX_DELAY = 300.0
+
+# Caps the number of OpenAI requests in flight from this process. asyncio semaphores belong to one
+# event loop, so a new one is made whenever the running loop changes (e.g. successive asyncio.run calls).
+_MAX_CONCURRENT_REQUESTS = 10
+_request_semaphore = None
+_request_semaphore_loop = None
+
+def _get_request_semaphore() -> asyncio.Semaphore:
+    global _request_semaphore, _request_semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _request_semaphore is None or _request_semaphore_loop is not loop:
+        _request_semaphore = asyncio.Semaphore(_MAX_CONCURRENT_REQUESTS)
+        _request_semaphore_loop = loop
+    return _request_semaphore
+
+def _prompt_cache_key(system_prompt: str) -> Dict:
+    """
+    Extra request body routing every call that starts with the same system prompt to the same
+    prompt-cache shard, which raises the hit rate on the shared static prefix.
+    """
+    return {"prompt_cache_key": "nurselens-" + make_cache_key(system_prompt).hex()}
+
+# The invariant system prompt for the initial analysis, built once at import and shared by every client.
+# It is assembled from parts so a variant without the Tissue Percentages Over Time section (and its
+# example) can be offered.
+_CP_HEADERS = """
         You are a world-class dermatologist AI. Your task is to analyze the provided wound image and clinical data.
         You MUST provide a strictly structured response with the following sections EXACTLY as named:
         **Case Information:**
@@ -29,8 +172,12 @@ class OpenAIClient(AIClientInterface):
         **Recommended Products:**
         **Wound Tissue Evaluation:**
         **Wound Summary:**
-        **Tissue Percentages Over Time:**
+"""
 
+_CP_TIMESERIES_HEADER = """        **Tissue Percentages Over Time:**
+"""
+
+_CP_EXAMPLES_CORE = """
         Follow the format of the user's prompt for the Case Information section.
         For all other sections, use the following examples as a reference for format and style. Your own evaluation MUST be based on the image and data provided.
 
@@ -64,44 +211,170 @@ class OpenAIClient(AIClientInterface):
         **Wound Summary:**
         Wound: Not determinable from provided data; the provided image does not display a visible epithelial break or focused wound. Clinical tactile assessment and calibrated measurement are required for definitive description.
 
-        **Tissue Percentages Over Time:**
+"""
+
+_CP_EXAMPLES_TIMESERIES = """        **Tissue Percentages Over Time:**
         IMPORTANT: For this section, all values for Granulation, Slough, Eschar, and Epithelialization MUST be an integer percentage (e.g., "30%", "0%", "15%"). DO NOT use descriptive words like "Minimal" or "None". The four percentages for each day MUST add up to exactly 100%.
+        Format each day exactly like this example:
         **Day 0:**
         - Granulation: 60%
         - Slough: 30%
         - Eschar: 10%
         - Epithelialization: 0%
-        **Day 7:**
-        - Granulation: 55%
-        - Slough: 25%
-        - Eschar: 15%
-        - Epithelialization: 5%
-        **Day 14:**
-        - Granulation: 50%
-        - Slough: 20%
-        - Eschar: 10%
-        - Epithelialization: 20%
-        **Day 21:**
-        - Granulation: 45%
-        - Slough: 15%
-        - Eschar: 5%
-        - Epithelialization: 35%
-        
+        Give the same four lines for each of Day 0, Day 7, Day 14 and Day 21, in that order.
+"""
+
+_CP_CLOSING = """        
         --- END EXAMPLES ---
 
         Base your entire analysis on the VISIBLE information in the image and the clinical data provided. Be specific. Do not invent data.
         """
 
+_CLINICAL_PROTOCOL = _CP_HEADERS + _CP_TIMESERIES_HEADER + _CP_EXAMPLES_CORE + _CP_EXAMPLES_TIMESERIES + _CP_CLOSING
+_CLINICAL_PROTOCOL_NO_TIMESERIES = _CP_HEADERS + _CP_EXAMPLES_CORE + _CP_CLOSING
+
+class OpenAIClient(AIClientInterface):
+    # The invariant system prompt, bound once on the class and shared by every instance. It is
+    # byte-identical on every call, so it can hit provider prompt caching.
+    clinical_protocol = _CLINICAL_PROTOCOL
+
+    # SDK clients shared by every OpenAIClient with the same API key, so they share one connection pool.
+    # Async clients hold connections bound to the event loop they were first used on, so they are kept
+    # per (API key, loop) in the same way as the request semaphore: a new one is made when the loop changes.
+    _shared_clients: Dict[str, OpenAI] = {}
+    _shared_async_clients: Dict[str, tuple] = {}
+    _shared_clients_lock = threading.Lock()
+
+    @classmethod
+    def _get_shared_client(cls, api_key: str) -> OpenAI:
+        """Returns the sync OpenAI client for `api_key`, creating it on first use."""
+        with cls._shared_clients_lock:
+            client = cls._shared_clients.get(api_key)
+            if client is None:
+                # Retries are handled in _with_retries, so the SDK's own retries are turned off
+                client = cls._shared_clients[api_key] = OpenAI(
+                    api_key=api_key, max_retries=0,
+                    http_client=httpx.Client(http2=_HTTP2_AVAILABLE, limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT, verify=_SSL_CONTEXT)
+                )
+            return client
+
+    @classmethod
+    def _get_shared_async_client(cls, api_key: str) -> AsyncOpenAI:
+        """Returns the AsyncOpenAI client for `api_key` on the running event loop, creating it when the loop changes."""
+        loop = asyncio.get_running_loop()
+        with cls._shared_clients_lock:
+            entry = cls._shared_async_clients.get(api_key)
+            if entry is None or entry[0] is not loop:
+                async_client = AsyncOpenAI(
+                    api_key=api_key, max_retries=0,
+                    http_client=httpx.AsyncClient(http2=_HTTP2_AVAILABLE, limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT, verify=_SSL_CONTEXT)
+                )
+                entry = cls._shared_async_clients[api_key] = (loop, async_client)
+            return entry[1]
+
+    @classmethod
+    def close_shared_clients(cls) -> None:
+        """
+        Closes the pooled sync connections. The pool is shared by every instance, so this runs
+        once at interpreter exit rather than per instance. Async clients cannot be closed from
+        here; use aclose_shared_clients inside their event loop.
+        """
+        with cls._shared_clients_lock:
+            for sync_client in cls._shared_clients.values():
+                sync_client.close()
+            cls._shared_clients.clear()
+
+    @classmethod
+    async def aclose_shared_clients(cls) -> None:
+        """Closes the pooled async clients created on the running event loop; call it before the loop ends."""
+        loop = asyncio.get_running_loop()
+        with cls._shared_clients_lock:
+            closing = [(api_key, client) for api_key, (client_loop, client) in cls._shared_async_clients.items() if client_loop is loop]
+            for api_key, _ in closing:
+                del cls._shared_async_clients[api_key]
+        for _, async_client in closing:
+            await async_client.close()
+
+    # Images uploaded to the Files API, shared by every instance: image cache key -> file_id (keys include
+    # the API key), and every file_id still to delete per API key, including ones evicted from the cache.
+    # One atexit hook over this registry cleans them up, so no instance is kept alive just for cleanup.
+    _image_file_ids = ResponseCache(maxsize=256)
+    _uploaded_file_ids: Dict[str, set] = {}
+    _uploaded_file_ids_lock = threading.Lock()
+
+    @property
+    def aclient(self) -> AsyncOpenAI:
+        """The shared AsyncOpenAI client for this API key on the running event loop."""
+        return self._get_shared_async_client(self.api_key)
+
+    # ... (__init__ and clinical_protocol are fine)
+    def __init__(self, api_key: str = None, model: str = "gpt-4o", use_file_uploads: bool = False, combine_follow_ups: bool = False, include_timeseries: bool = True):
+        load_dotenv()
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        if not self.api_key:
+            raise ValueError("OPENAI_API_KEY not found in environment variables.")
+        
+        self.client = self._get_shared_client(self.api_key)
+        self.model = model
+        # Initial analyses keyed by a hash of the model, prompt and image, so identical re-runs skip the API
+        self._analysis_cache = ResponseCache(maxsize=256)
+        # Follow-up results keyed by a hash of the model, messages and sampling settings, so identical requests skip the API
+        self._follow_up_cache = ResponseCache(maxsize=512, ttl=3600)
+        # When enabled, images are uploaded once to the Files API and referenced by file_id instead of inline base64
+        self.use_file_uploads = use_file_uploads
+        # When enabled, expand + revise for one analysis are answered by a single request (half the RPM)
+        # instead of two concurrent ones (lower latency)
+        self.combine_follow_ups = combine_follow_ups
+        # Callers that never display Tissue Percentages Over Time can send the shorter protocol
+        # (about a quarter fewer system tokens); it gets its own prompt-cache key
+        if not include_timeseries:
+            self.clinical_protocol = _CLINICAL_PROTOCOL_NO_TIMESERIES
+
+
+    def _with_retries(self, request: Callable):
+        """
+        Runs `request()`, retrying transient errors (rate limits, timeouts, connection and server errors)
+        up to _MAX_ATTEMPTS times with jittered exponential backoff.
+        """
+        for attempt in range(_MAX_ATTEMPTS):
+            try:
+                return request()
+            except _RETRYABLE_ERRORS as e:
+                if attempt == _MAX_ATTEMPTS - 1:
+                    raise
+                delay = _retry_delay(attempt, e)
+                print(f"DEBUG: Transient OpenAI error ({type(e).__name__}); retrying in {delay:.1f}s.")
+                time.sleep(delay)
+
+    async def _with_retries_async(self, request: Callable):
+        """
+        Async version of _with_retries for a coroutine factory. At most _MAX_CONCURRENT_REQUESTS
+        requests are in flight at once, and a request waiting to retry does not hold a slot.
+        """
+        for attempt in range(_MAX_ATTEMPTS):
+            try:
+                async with _get_request_semaphore():
+                    return await request()
+            except _RETRYABLE_ERRORS as e:
+                if attempt == _MAX_ATTEMPTS - 1:
+                    raise
+                delay = _retry_delay(attempt, e)
+                print(f"DEBUG: Transient OpenAI error ({type(e).__name__}); retrying in {delay:.1f}s.")
+                await asyncio.sleep(delay)
 
     def _make_api_call(self, messages: List[Dict], max_tokens: int, temperature: float) -> str:
-        """A single, reliable method for making all API calls."""
+        """
+        A single, reliable method for making all API calls.
+        Transient errors are retried with jittered exponential backoff (see _with_retries).
+        """
         try:
-            response = self.client.chat.completions.create(
+            response = self._with_retries(lambda: self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 max_tokens=max_tokens,
-                temperature=temperature
-            )
+                temperature=temperature,
+                extra_body=_prompt_cache_key(messages[0]["content"])
+            ))
             return response.choices[0].message.content
         except Exception as e:
             # --- THIS IS THE FIX ---
@@ -112,15 +385,54 @@ class OpenAIClient(AIClientInterface):
             raise Exception(error_message)
             # -----------------------
 
-    # The rest of the methods in this file (get_initial_analysis, expand_treatment_plan, etc.)
-    # do not need to be changed. They correctly use the _make_api_call helper.
-    def get_initial_analysis(self, prompt: str, base64_image: str) -> str:
+    async def _make_api_call_async(self, messages: List[Dict], max_tokens: int, temperature: float) -> str:
+        """Async version of _make_api_call with the same retry policy and a cap on concurrent requests."""
+        try:
+            response = await self._with_retries_async(lambda: self.aclient.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                extra_body=_prompt_cache_key(messages[0]["content"])
+            ))
+            return response.choices[0].message.content
+        except Exception as e:
+            error_message = f"OpenAI API call failed: {str(e)}"
+            print(f"CRITICAL API ERROR: {error_message}")
+            raise Exception(error_message)
+
+    def _stream_api_call(self, messages: List[Dict], max_tokens: int, temperature: float) -> Iterator[str]:
         """
-        Performs the primary wound analysis with an image.
-        This method is now self-contained and guaranteed to be correct.
+        Streaming variant of _make_api_call: yields the reply text as it arrives.
+        Opening the stream follows the same retry policy; once text has been yielded, errors are not retried.
         """
+        try:
+            stream = self._with_retries(lambda: self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                extra_body=_prompt_cache_key(messages[0]["content"])
+            ))
+
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        except Exception as e:
+            error_message = f"OpenAI API call failed: {str(e)}"
+            print(f"CRITICAL API ERROR: {error_message}")
+            raise Exception(error_message)
+
+    # The rest of the methods in this file (get_initial_analysis, expand_treatment_plan, etc.)
+    # do not need to be changed. They correctly use the _make_api_call helper.
+    def _initial_analysis_messages(self, prompt: str, base64_image: str) -> List[Dict]:
+        """Builds the multimodal messages for the primary wound analysis."""
         print("DEBUG: Constructing multimodal message for OpenAI.")
-        messages = [
+        return [
             {
                 "role": "system",
                 "content": self.clinical_protocol
@@ -142,163 +454,486 @@ class OpenAIClient(AIClientInterface):
                 ]
             }
         ]
-        
-        print("DEBUG: Sending request to OpenAI for image analysis...")
-        return self._make_api_call(messages=messages, max_tokens=2000, temperature=0.2)
 
+    def _file_analysis_request(self, prompt: str, file_id: str) -> Dict:
+        """
+        Builds a Responses API request referencing an uploaded image by file_id.
+        Chat Completions only accepts images inline, so file_id images go through the Responses API.
+        """
+        return {
+            "model": self.model,
+            "instructions": self.clinical_protocol,
+            "input": [{
+                "role": "user",
+                "content": [
+                    {"type": "input_text", "text": prompt},
+                    {"type": "input_image", "file_id": file_id, "detail": "high"}
+                ]
+            }],
+            "max_output_tokens": 2000,
+            "temperature": 0.2,
+            "extra_body": _prompt_cache_key(self.clinical_protocol)
+        }
+
+    def _image_file_id(self, base64_image: str) -> str:
+        """Uploads an image to the Files API once and returns its file_id; a repeated image reuses the earlier upload."""
+        image_key = make_cache_key(self.api_key, base64_image)
+        file_id = self._image_file_ids.get(image_key)
+        if file_id is None:
+            print("DEBUG: Uploading wound image to OpenAI's file store...")
+            image_file = ("wound.jpg", self.decode_image(base64_image), "image/jpeg")
+            file_id = self._with_retries(lambda: self.client.files.create(file=image_file, purpose="vision")).id
+            self._record_upload(image_key, file_id)
+        return file_id
+
+    async def _image_file_id_async(self, base64_image: str) -> str:
+        """Async version of _image_file_id."""
+        image_key = make_cache_key(self.api_key, base64_image)
+        file_id = self._image_file_ids.get(image_key)
+        if file_id is None:
+            print("DEBUG: Uploading wound image to OpenAI's file store...")
+            image_file = ("wound.jpg", self.decode_image(base64_image), "image/jpeg")
+            file_id = (await self._with_retries_async(lambda: self.aclient.files.create(file=image_file, purpose="vision"))).id
+            self._record_upload(image_key, file_id)
+        return file_id
+
+    def _record_upload(self, image_key: bytes, file_id: str) -> None:
+        """Adds a new upload to the shared registry, so it is reused by every instance and deleted at exit."""
+        with self._uploaded_file_ids_lock:
+            self._uploaded_file_ids.setdefault(self.api_key, set()).add(file_id)
+        self._image_file_ids.set(image_key, file_id)
+
+    @staticmethod
+    def _delete_uploaded_image(client: OpenAI, file_id: str) -> None:
+        """Deletes one uploaded image, reporting rather than raising on failure (e.g. a 404 for a file already gone)."""
+        try:
+            client.files.delete(file_id)
+        except Exception as e:
+            print(f"DEBUG: Could not delete uploaded image {file_id} ({str(e)}).")
 
-    def expand_treatment_plan(self, original_analysis: str) -> Dict:
-        """Generates an expanded treatment plan and returns it as a structured JSON object."""
+    @classmethod
+    def delete_uploaded_images(cls) -> None:
+        """
+        Deletes every image uploaded to the Files API by any OpenAIClient, concurrently and each on its
+        own, so one failed delete does not leave the others behind. Runs automatically at interpreter exit.
+        """
+        with cls._uploaded_file_ids_lock:
+            uploads = [(api_key, file_id) for api_key, file_ids in cls._uploaded_file_ids.items() for file_id in file_ids]
+            cls._uploaded_file_ids.clear()
+        cls._image_file_ids.clear()
+        if not uploads:
+            return
+        print(f"DEBUG: Cleaning up {len(uploads)} uploaded image(s) from OpenAI's file store...")
+        with ThreadPoolExecutor(max_workers=min(len(uploads), 8)) as executor:
+            list(executor.map(lambda upload: cls._delete_uploaded_image(cls._get_shared_client(upload[0]), upload[1]), uploads))
+
+    def _try_image_file_id(self, base64_image: str):
+        """Returns the image's file_id, or None when the upload is rejected so the caller can fall back to inline base64."""
         try:
-            # Safely extract the initial, brief treatment plan from the first analysis
-            treatment_section_match = re.search(r'\*\*Treatment Plan:\*\*(.*?)\*\*Recommended Products:\*\*', original_analysis, re.DOTALL)
-            if not treatment_section_match:
-                return {"success": False, "error": "Could not find 'Treatment Plan' in the original analysis to expand."}
-            treatment_section = treatment_section_match.group(1).strip()
-
-            # Define the one-shot example for the desired JSON structure
-            one_shot_example = """
-            "recommendations": [
-                {
-                    "action": "Perform a focused in-person wound assessment including calibrated measurements...",
-                    "rationale": "Accurate characterization and microbiology are necessary to direct appropriate therapy."
-                },
-                {
-                    "action": "Irrigate the wound with sterile 0.9% saline...",
-                    "rationale": "Mechanical irrigation reduces surface bioburden and aids assessment while preserving viable tissue."
-                }
-            ],
-            "ongoing_care": "Change dressings every 48–72 hours or sooner if saturated... Escalate to urgent evaluation if any of the following occur: ...",
-            "patient_education": "Educate the patient and caregiver on signs of infection and the importance of dressing changes."
-            """
+            return self._image_file_id(base64_image)
+        except Exception as e:
+            print(f"DEBUG: Image upload failed ({str(e)}); falling back to inline base64.")
+            return None
 
-            # Build the full prompt for the AI
-            expand_prompt = f"""
-            Based on the original treatment plan below, provide a comprehensive expanded treatment plan.
-            You MUST return a single, valid JSON object and nothing else. Do not include any introductory text or markdown formatting.
-            The JSON object must have three keys: "recommendations" (a list of objects, each with "action" and "rationale"), "ongoing_care" (a string), and "patient_education" (a string).
+    def _analyze_with_file_id(self, prompt: str, base64_image: str):
+        """
+        Runs the initial analysis with the image referenced by file_id.
+        Returns None when the upload is rejected, so the caller can fall back to inline base64.
+        """
+        file_id = self._try_image_file_id(base64_image)
+        if file_id is None:
+            return None
+        try:
+            print("DEBUG: Sending request to OpenAI for image analysis (file_id)...")
+            response = self._with_retries(lambda: self.client.responses.create(**self._file_analysis_request(prompt, file_id)))
+            return response.output_text
+        except Exception as e:
+            error_message = f"OpenAI API call failed: {str(e)}"
+            print(f"CRITICAL API ERROR: {error_message}")
+            raise Exception(error_message)
 
-            --- EXAMPLE of desired JSON structure ---
-            {{
-            {one_shot_example}
-            }}
-            --- END EXAMPLE ---
+    def _stream_file_analysis(self, prompt: str, file_id: str) -> Iterator[str]:
+        """
+        Streaming variant of _analyze_with_file_id for an already uploaded image: yields the text deltas
+        of a streamed Responses API call. Opening the stream follows the usual retry policy.
+        """
+        try:
+            stream = self._with_retries(lambda: self.client.responses.create(stream=True, **self._file_analysis_request(prompt, file_id)))
+            for event in stream:
+                if event.type == "response.output_text.delta" and event.delta:
+                    yield event.delta
+        except Exception as e:
+            error_message = f"OpenAI API call failed: {str(e)}"
+            print(f"CRITICAL API ERROR: {error_message}")
+            raise Exception(error_message)
 
-            Now, generate the JSON for the following case:
+    async def _analyze_with_file_id_async(self, prompt: str, base64_image: str):
+        """Async version of _analyze_with_file_id."""
+        try:
+            file_id = await self._image_file_id_async(base64_image)
+        except Exception as e:
+            print(f"DEBUG: Image upload failed ({str(e)}); falling back to inline base64.")
+            return None
+        try:
+            print("DEBUG: Sending async request to OpenAI for image analysis (file_id)...")
+            response = await self._with_retries_async(lambda: self.aclient.responses.create(**self._file_analysis_request(prompt, file_id)))
+            return response.output_text
+        except Exception as e:
+            error_message = f"OpenAI API call failed: {str(e)}"
+            print(f"CRITICAL API ERROR: {error_message}")
+            raise Exception(error_message)
 
-            **Original Brief Treatment Plan:**
-            {treatment_section}
-            """
-            
-            # Prepare the messages for the API call
-            messages = [
-                {"role": "system", "content": "You are a JSON API that provides expanded wound care treatment plans. You always respond with a single, valid JSON object and nothing else."},
-                {"role": "user", "content": expand_prompt}
-            ]
+    def get_initial_analysis(self, prompt: str, base64_image: str) -> str:
+        """
+        Performs the primary wound analysis with an image.
+        This method is now self-contained and guaranteed to be correct.
+        """
+        cache_key = make_cache_key(self.model, prompt, base64_image)
+        cached_analysis = self._analysis_cache.get(cache_key)
+        if cached_analysis is not None:
+            print("DEBUG: Returning cached OpenAI image analysis.")
+            return cached_analysis
+
+        analysis = self._analyze_with_file_id(prompt, base64_image) if self.use_file_uploads else None
+        if analysis is None:
+            messages = self._initial_analysis_messages(prompt, base64_image)
+            print("DEBUG: Sending request to OpenAI for image analysis...")
+            analysis = self._make_api_call(messages=messages, max_tokens=2000, temperature=0.2)
+        self._analysis_cache.set(cache_key, analysis)
+        return analysis
+
+    def get_initial_analysis_stream(self, prompt: str, base64_image: str) -> Iterator[str]:
+        """
+        Streaming version of get_initial_analysis: yields the analysis text as it is generated,
+        so callers can show or parse the leading sections before the completion finishes.
+        The finished text is added to the analysis cache, and a cached analysis is yielded as one chunk.
+        """
+        cache_key = make_cache_key(self.model, prompt, base64_image)
+        cached_analysis = self._analysis_cache.get(cache_key)
+        if cached_analysis is not None:
+            print("DEBUG: Returning cached OpenAI image analysis.")
+            yield cached_analysis
+            return
+
+        file_id = self._try_image_file_id(base64_image) if self.use_file_uploads else None
+        if file_id is not None:
+            print("DEBUG: Streaming request to OpenAI for image analysis (file_id)...")
+            deltas = self._stream_file_analysis(prompt, file_id)
+        else:
+            messages = self._initial_analysis_messages(prompt, base64_image)
+            print("DEBUG: Streaming request to OpenAI for image analysis...")
+            deltas = self._stream_api_call(messages=messages, max_tokens=2000, temperature=0.2)
+        chunks = []
+        for delta in deltas:
+            chunks.append(delta)
+            yield delta
+        self._analysis_cache.set(cache_key, "".join(chunks))
+
+    async def get_initial_analysis_async(self, prompt: str, base64_image: str) -> str:
+        """Async version of get_initial_analysis using the AsyncOpenAI client."""
+        cache_key = make_cache_key(self.model, prompt, base64_image)
+        cached_analysis = self._analysis_cache.get(cache_key)
+        if cached_analysis is not None:
+            print("DEBUG: Returning cached OpenAI image analysis.")
+            return cached_analysis
+
+        analysis = await self._analyze_with_file_id_async(prompt, base64_image) if self.use_file_uploads else None
+        if analysis is None:
+            messages = self._initial_analysis_messages(prompt, base64_image)
+            print("DEBUG: Sending async request to OpenAI for image analysis...")
+            analysis = await self._make_api_call_async(messages=messages, max_tokens=2000, temperature=0.2)
+        self._analysis_cache.set(cache_key, analysis)
+        return analysis
+
+    def submit_batch_analysis(self, records: List[Dict]) -> str:
+        """
+        Submits initial analyses that do not need an immediate answer (e.g. bulk re-analysis of
+        historical data) to the OpenAI Batch API, which is billed at half price and has its own rate limits.
+        Each record is {"custom_id": str, "prompt": str, "base64_image": str}; custom_ids must be unique.
+        Returns the batch id to pass to wait_for_batch_analysis.
+        """
+        lines = []
+        for record in records:
+            body = {
+                "model": self.model,
+                "messages": self._initial_analysis_messages(record["prompt"], record["base64_image"]),
+                "max_tokens": 2000,
+                "temperature": 0.2,
+                **_prompt_cache_key(self.clinical_protocol)
+            }
+            lines.append(json.dumps({"custom_id": record["custom_id"], "method": "POST", "url": _BATCH_ENDPOINT, "body": body}))
+        batch_file = ("analysis_batch.jsonl", "\n".join(lines).encode("utf-8"), "application/jsonl")
+
+        print(f"DEBUG: Uploading batch of {len(records)} analyses to OpenAI...")
+        input_file = self._with_retries(lambda: self.client.files.create(file=batch_file, purpose="batch"))
+        batch = self._with_retries(lambda: self.client.batches.create(
+            input_file_id=input_file.id, endpoint=_BATCH_ENDPOINT, completion_window="24h"
+        ))
+        print(f"DEBUG: Batch submitted. Batch ID: {batch.id}")
+        return batch.id
+
+    def wait_for_batch_analysis(self, batch_id: str, timeout: float = None) -> Dict:
+        """
+        Polls a submitted batch with exponential backoff until it settles, then returns
+        {custom_id: analysis text, or None if that request failed}.
+        Raises if the batch fails, expires or is cancelled, or if `timeout` seconds pass first.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        delay = _BATCH_POLL_MIN_DELAY
+        batch = self._with_retries(lambda: self.client.batches.retrieve(batch_id))
+        while batch.status in _BATCH_PENDING_STATUSES:
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise TimeoutError(f"Batch {batch_id} still {batch.status} after {timeout:.0f}s.")
+            time.sleep(delay)
+            delay = min(delay * 2, _BATCH_POLL_MAX_DELAY)
+            batch = self._with_retries(lambda: self.client.batches.retrieve(batch_id))
+
+        if batch.status != "completed":
+            raise Exception(f"Batch {batch_id} ended with status: {batch.status}")
+
+        results = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            content = self._with_retries(lambda: self.client.files.content(file_id)).text
+            for line in content.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get("response") or {}
+                if response.get("status_code") == 200:
+                    results[entry["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+                else:
+                    results.setdefault(entry["custom_id"], None)
+        return results
+
+
+    def _expand_messages(self, treatment_section: str) -> List[Dict]:
+        """Builds the chat messages for a treatment plan expansion."""
+        expand_prompt = _EXPAND_PROMPT_TMPL.format_map({"treatment_section": treatment_section})
+        return [_EXPAND_SYSTEM_MESSAGE, {"role": "user", "content": expand_prompt}]
+
+    def _revise_messages(self, revision_reason: str, current_products: str) -> List[Dict]:
+        """Builds the chat messages for a product revision."""
+        revision_prompt = _REVISE_PROMPT_TMPL.format_map({
+            "revision_reason": revision_reason,
+            "instruction": _REVISION_INSTRUCTIONS.get(revision_reason, _DEFAULT_REVISION_INSTRUCTION),
+            "current_products": current_products
+        })
+        return [_REVISE_SYSTEM_MESSAGE, {"role": "user", "content": revision_prompt}]
+
+    def _expand_request(self, treatment_section: str) -> tuple:
+        """Returns the messages and cache key of an expansion."""
+        messages = self._expand_messages(treatment_section)
+        return messages, make_cache_key("expand_treatment_plan", self.model, messages, 2000, 0.1)
+
+    def _revise_request(self, revision_reason: str, current_products: str) -> tuple:
+        """Returns the messages and cache key of a product revision."""
+        messages = self._revise_messages(revision_reason, current_products)
+        return messages, make_cache_key("revise_products", self.model, messages, 1000, 0.1)
+
+    def _combined_messages(self, expand_messages: List[Dict], revise_messages: List[Dict]) -> List[Dict]:
+        """Packs the user prompts of an expansion and a revision into one request."""
+        combined_prompt = _COMBINED_PROMPT_TMPL.format_map({
+            "expand_prompt": expand_messages[1]["content"],
+            "revise_prompt": revise_messages[1]["content"]
+        })
+        return [_COMBINED_SYSTEM_MESSAGE, {"role": "user", "content": combined_prompt}]
+
+    def _cached_follow_up(self, cache_key: bytes, method_name: str):
+        """Returns the cached follow-up result for an identical request, or None."""
+        cached_result = self._follow_up_cache.get(cache_key)
+        if cached_result is not None:
+            print(f"DEBUG: Returning cached OpenAI {method_name} result.")
+        return cached_result
+
+    def _parse_json_reply(self, response_text: str, result_key: str, decode_error: str, cache_key: bytes) -> Dict:
+        """
+        Safely parses the JSON reply from the AI into the result dictionary expected by the facade.
+        Successful results are stored in the follow-up cache.
+        """
+        try:
+            json_response = extract_json(response_text)
+        except json.JSONDecodeError:
+            return {"success": False, "error": decode_error, "raw_response": response_text}
+
+        return self._store_follow_up(result_key, json_response, cache_key)
+
+    def _store_follow_up(self, result_key: str, json_response, cache_key: bytes) -> Dict:
+        """Wraps a parsed follow-up reply in its result dictionary and stores it in the follow-up cache."""
+        result = {"success": True, result_key: json_response}
+        self._follow_up_cache.set(cache_key, result)
+        return result
+
+    def _parse_combined_reply(self, response_text: str, expand_key: bytes, revise_key: bytes) -> tuple:
+        """Splits a combined follow-up reply into (expand_result, revise_result), caching each part that parsed."""
+        try:
+            json_response = extract_json(response_text)
+        except json.JSONDecodeError:
+            json_response = {}
+        if not isinstance(json_response, dict):
+            json_response = {}
+
+        results = []
+        for part_key, result_key, decode_error, cache_key in (
+            ("expanded_plan", "expanded_plan_json", "Failed to decode AI's JSON response for the expanded plan.", expand_key),
+            ("product_revision", "revised_products_json", "Failed to decode AI's JSON response for revised products.", revise_key)
+        ):
+            part = json_response.get(part_key)
+            if isinstance(part, dict):
+                results.append(self._store_follow_up(result_key, part, cache_key))
+            else:
+                results.append({"success": False, "error": decode_error, "raw_response": response_text})
+        return tuple(results)
+
+    def _extract_treatment_section(self, original_analysis: str):
+        """Safely extracts the initial, brief treatment plan from the first analysis, or returns None."""
+        return parse_sections(original_analysis).get("Treatment Plan")
+
+    def _extract_current_products(self, original_analysis: str):
+        """Safely extracts the current product list, or returns None."""
+        return parse_sections(original_analysis).get("Recommended Products")
+
+    def expand_treatment_plan(self, original_analysis: str, treatment_section: str = None) -> Dict:
+        """Generates an expanded treatment plan and returns it as a structured JSON object."""
+        try:
+            # Extract the treatment plan unless the caller already did
+            if treatment_section is None:
+                treatment_section = self._extract_treatment_section(original_analysis)
+                if treatment_section is None:
+                    return {"success": False, "error": "Could not find 'Treatment Plan' in the original analysis to expand."}
+
+            messages, cache_key = self._expand_request(treatment_section)
+            cached_result = self._cached_follow_up(cache_key, "expand_treatment_plan")
+            if cached_result is not None:
+                return cached_result
 
-            # Make the API call
             response_text = self._make_api_call(messages=messages, max_tokens=2000, temperature=0.1)
-            
-            # Safely parse the JSON response from the AI
-            try:
-                cleaned_text = re.sub(r'```json\s*|\s*```', '', response_text).strip()
-                json_response = json.loads(cleaned_text)
-                # Return the dictionary with the correct key as expected by the facade
-                return {"success": True, "expanded_plan_json": json_response}
-            except json.JSONDecodeError:
-                return {"success": False, "error": "Failed to decode AI's JSON response for the expanded plan.", "raw_response": response_text}
+            return self._parse_json_reply(response_text, "expanded_plan_json", "Failed to decode AI's JSON response for the expanded plan.", cache_key)
         
         except Exception as e:
             return {"success": False, "error": f"Error in OpenAI expand_treatment_plan: {str(e)}"}
 
+    async def expand_treatment_plan_async(self, original_analysis: str, treatment_section: str = None) -> Dict:
+        """Async version of expand_treatment_plan using the AsyncOpenAI client."""
+        try:
+            if treatment_section is None:
+                treatment_section = self._extract_treatment_section(original_analysis)
+                if treatment_section is None:
+                    return {"success": False, "error": "Could not find 'Treatment Plan' in the original analysis to expand."}
+
+            messages, cache_key = self._expand_request(treatment_section)
+            cached_result = self._cached_follow_up(cache_key, "expand_treatment_plan")
+            if cached_result is not None:
+                return cached_result
+
+            response_text = await self._make_api_call_async(messages=messages, max_tokens=2000, temperature=0.1)
+            return self._parse_json_reply(response_text, "expanded_plan_json", "Failed to decode AI's JSON response for the expanded plan.", cache_key)
+        
+        except Exception as e:
+            return {"success": False, "error": f"Error in OpenAI expand_treatment_plan: {str(e)}"}
 
-    def revise_products(self, original_analysis: str, revision_reason: str) -> Dict:
+    def revise_products(self, original_analysis: str, revision_reason: str, current_products: str = None) -> Dict:
         """Revises product recommendations and returns them as a structured JSON object."""
         try:
-            # Define instructions based on the revision reason
-            instruction = {
-                "Patient Won't Tolerate": "Focus on gentle, hypoallergenic products that are comfortable for sensitive patients.",
-                "Too Costly": "Recommend cost-effective, generic alternatives and basic wound care supplies.",
-                "Products Unavailable": "Suggest readily available alternatives that can be found in most pharmacies.",
-                "Other": "Provide alternative product recommendations with different mechanisms of action."
-            }.get(revision_reason, "Provide alternative product recommendations.")
-
-            # Safely extract the current product list
-            products_match = re.search(r'\*\*Recommended Products:\*\*(.*?)\*\*Wound Tissue Evaluation:\*\*', original_analysis, re.DOTALL)
-            if not products_match:
-                return {"success": False, "error": "Could not find 'Recommended Products' in the original analysis to revise."}
-            current_products = products_match.group(1).strip()
-
-            # Build the full prompt for the AI
-            revision_prompt = f"""
-            The current recommended products need to be revised based on the constraint: "{revision_reason}".
-            
-            Instruction: {instruction}
-            
-            Current Recommended Products:
-            {current_products}
-            
-            You MUST return a single, valid JSON object and nothing else.
-            The JSON object must have one key: "revised_products", which is a list of objects. Each object should have two keys: "product_name" and "rationale".
+            # Extract the current product list unless the caller already did
+            if current_products is None:
+                current_products = self._extract_current_products(original_analysis)
+                if current_products is None:
+                    return {"success": False, "error": "Could not find 'Recommended Products' in the original analysis to revise."}
 
-            --- EXAMPLE of desired JSON structure ---
-            {{
-              "revised_products": [
-                {{
-                  "product_name": "Generic Sterile Saline (0.9%)",
-                  "rationale": "A cost-effective alternative for wound cleansing that is widely available."
-                }},
-                {{
-                  "product_name": "Basic Non-adherent Gauze",
-                  "rationale": "Provides a budget-friendly primary dressing to protect the wound bed."
-                }}
-              ]
-            }}
-            --- END EXAMPLE ---
-            """
-            
-            # Prepare the messages for the API call
-            messages = [
-                {"role": "system", "content": "You are a JSON API that provides revised wound care product recommendations. You always respond with a single, valid JSON object and nothing else."},
-                {"role": "user", "content": revision_prompt}
-            ]
+            messages, cache_key = self._revise_request(revision_reason, current_products)
+            cached_result = self._cached_follow_up(cache_key, "revise_products")
+            if cached_result is not None:
+                return cached_result
 
-            # Make the API call
             response_text = self._make_api_call(messages=messages, max_tokens=1000, temperature=0.1)
-            
-            # Safely parse the JSON response from the AI
-            try:
-                cleaned_text = re.sub(r'```json\s*|\s*```', '', response_text).strip()
-                json_response = json.loads(cleaned_text)
-                # Return the dictionary with the correct key as expected by the facade
-                return {"success": True, "revised_products_json": json_response}
-            except json.JSONDecodeError:
-                return {"success": False, "error": "Failed to decode AI's JSON response for revised products.", "raw_response": response_text}
+            return self._parse_json_reply(response_text, "revised_products_json", "Failed to decode AI's JSON response for revised products.", cache_key)
         
         except Exception as e:
             return {"success": False, "error": f"Error in OpenAI revise_products: {str(e)}"}
 
+    async def revise_products_async(self, original_analysis: str, revision_reason: str, current_products: str = None) -> Dict:
+        """Async version of revise_products using the AsyncOpenAI client."""
+        try:
+            if current_products is None:
+                current_products = self._extract_current_products(original_analysis)
+                if current_products is None:
+                    return {"success": False, "error": "Could not find 'Recommended Products' in the original analysis to revise."}
+
+            messages, cache_key = self._revise_request(revision_reason, current_products)
+            cached_result = self._cached_follow_up(cache_key, "revise_products")
+            if cached_result is not None:
+                return cached_result
+
+            response_text = await self._make_api_call_async(messages=messages, max_tokens=1000, temperature=0.1)
+            return self._parse_json_reply(response_text, "revised_products_json", "Failed to decode AI's JSON response for revised products.", cache_key)
+        
+        except Exception as e:
+            return {"success": False, "error": f"Error in OpenAI revise_products: {str(e)}"}
 
-    def get_healing_progress(self, pdf_path: str) -> Dict:
+    def _prepare_combined(self, original_analysis: str, revision_reason: str, treatment_section: str, current_products: str):
+        """
+        Returns (messages, expand_key, revise_key) for a combined follow-up request, or None when
+        combining is off or would not save a request (a section is missing, or either result is cached).
+        """
+        if not self.combine_follow_ups:
+            return None
+        if treatment_section is None:
+            treatment_section = self._extract_treatment_section(original_analysis)
+        if current_products is None:
+            current_products = self._extract_current_products(original_analysis)
+        if treatment_section is None or current_products is None:
+            return None
+
+        expand_messages, expand_key = self._expand_request(treatment_section)
+        revise_messages, revise_key = self._revise_request(revision_reason, current_products)
+        if self._follow_up_cache.get(expand_key) is not None or self._follow_up_cache.get(revise_key) is not None:
+            return None
+        return self._combined_messages(expand_messages, revise_messages), expand_key, revise_key
+
+    def expand_and_revise(self, original_analysis: str, revision_reason: str, treatment_section: str = None, current_products: str = None) -> tuple:
         """
-        Analyzes a PDF of wound history using the OpenAI Assistants API and a more nuanced prompt.
+        With combine_follow_ups enabled, answers the expansion and the revision with one request,
+        halving the requests spent on follow-ups; otherwise they run as separate calls.
         """
         try:
-            # ... (The file upload and assistant creation logic is correct)
-            print(f"DEBUG: Uploading PDF {pdf_path} to OpenAI's file store...")
-            with open(pdf_path, "rb") as pdf_file:
-                uploaded_file = self.client.files.create(file=pdf_file, purpose='assistants')
-            print(f"DEBUG: PDF uploaded successfully. File ID: {uploaded_file.id}")
-
-            assistant = self.client.beta.assistants.create(
-                name="Wound Healing Analyst",
-                instructions="You are a wound care specialist. Analyze the attached file which contains a wound's healing history. Respond with only a valid JSON object containing a single key: 'healing_progress_percentage'.",
-                model=self.model,
-                tools=[{"type": "file_search"}]
-            )
+            combined = self._prepare_combined(original_analysis, revision_reason, treatment_section, current_products)
+            if combined is None:
+                return super().expand_and_revise(original_analysis, revision_reason, treatment_section, current_products)
+
+            messages, expand_key, revise_key = combined
+            print("DEBUG: Sending combined expand + revise request to OpenAI...")
+            response_text = self._make_api_call(messages=messages, max_tokens=3000, temperature=0.1)
+            return self._parse_combined_reply(response_text, expand_key, revise_key)
+
+        except Exception as e:
+            error = {"success": False, "error": f"Error in OpenAI expand_and_revise: {str(e)}"}
+            return error, dict(error)
 
-            # --- THIS IS THE NEW, MORE NUANCED PROMPT ---
-            nuanced_user_prompt = """
+    async def expand_and_revise_async(self, original_analysis: str, revision_reason: str, treatment_section: str = None, current_products: str = None) -> tuple:
+        """Async version of expand_and_revise; without combining, the two follow-ups run concurrently."""
+        try:
+            combined = self._prepare_combined(original_analysis, revision_reason, treatment_section, current_products)
+            if combined is None:
+                return await super().expand_and_revise_async(original_analysis, revision_reason, treatment_section, current_products)
+
+            messages, expand_key, revise_key = combined
+            print("DEBUG: Sending combined async expand + revise request to OpenAI...")
+            response_text = await self._make_api_call_async(messages=messages, max_tokens=3000, temperature=0.1)
+            return self._parse_combined_reply(response_text, expand_key, revise_key)
+
+        except Exception as e:
+            error = {"success": False, "error": f"Error in OpenAI expand_and_revise: {str(e)}"}
+            return error, dict(error)
+
+
+    def _healing_progress_messages(self, pdf_path: str) -> List[Dict]:
+        """Builds a single chat request carrying the prompt and the history PDF inline."""
+        pdf_base64 = self.encode_pdf(pdf_path)
+
+        # --- THIS IS THE NEW, MORE NUANCED PROMPT ---
+        nuanced_user_prompt = """
             The attached PDF contains the complete history of a single wound, with the first page being the baseline.
             Your task is to provide a nuanced 'Healing Progress Percentage' based on the LATEST image in the sequence.
 
@@ -310,44 +945,62 @@ class OpenAIClient(AIClientInterface):
 
             Analyze the LATEST image in the PDF and assess its state relative to the final goal of a fully mature, pale scar. Based on this, provide a single integer for the healing progress percentage.
             """
-            # ------------------------------------------------
+        # ------------------------------------------------
 
-            thread = self.client.beta.threads.create(
-                messages=[
+        return [
+            {
+                "role": "system",
+                "content": "You are a wound care specialist. Analyze the attached file which contains a wound's healing history. Respond with only a valid JSON object containing a single key: 'healing_progress_percentage'."
+            },
+            {
+                "role": "user",
+                "content": [
                     {
-                        "role": "user",
-                        "content": nuanced_user_prompt, # Use the new prompt
-                        "attachments": [{"file_id": uploaded_file.id, "tools": [{"type": "file_search"}]}]
+                        "type": "text",
+                        "text": nuanced_user_prompt
+                    },
+                    {
+                        "type": "file",
+                        "file": {
+                            "filename": os.path.basename(pdf_path),
+                            "file_data": f"data:application/pdf;base64,{pdf_base64}"
+                        }
                     }
                 ]
-            )
-
-            # ... (The rest of the run, wait, and cleanup logic is correct and does not need to change)
-            run = self.client.beta.threads.runs.create(thread_id=thread.id, assistant_id=assistant.id)
-
-            print("DEBUG: Waiting for the AI assistant to complete the analysis...")
-            while run.status in ['queued', 'in_progress', 'cancelling']:
-                time.sleep(1)
-                run = self.client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
-
-            if run.status == 'completed':
-                messages = self.client.beta.threads.messages.list(thread_id=thread.id)
-                response_text = messages.data[0].content[0].text.value
-                
-                cleaned_text = re.sub(r'```json\s*|\s*```', '', response_text).strip()
-                json_response = json.loads(cleaned_text)
-                
-                print("DEBUG: Cleaning up OpenAI resources...")
-                self.client.files.delete(uploaded_file.id)
-                self.client.beta.assistants.delete(assistant.id)
-                self.client.beta.threads.delete(thread.id)
-                
-                return {"success": True, "healing_progress_json": json_response}
-            else:
-                self.client.files.delete(uploaded_file.id)
-                self.client.beta.assistants.delete(assistant.id)
-                self.client.beta.threads.delete(thread.id)
-                raise Exception(f"Assistant run failed with status: {run.status}")
+            }
+        ]
+
+    def get_healing_progress(self, pdf_path: str) -> Dict:
+        """
+        Analyzes a PDF of wound history with a single multimodal chat completion and a more nuanced prompt.
+        The PDF is sent inline, so there is no upload, assistant, thread or polling to wait on.
+        """
+        try:
+            messages = self._healing_progress_messages(pdf_path)
+
+            print("DEBUG: Sending request to OpenAI for healing progress analysis...")
+            response_text = self._make_api_call(messages=messages, max_tokens=50, temperature=0.0)
+            json_response = extract_json(response_text)
+
+            return {"success": True, "healing_progress_json": json_response}
 
         except Exception as e:
             return {"success": False, "error": f"Error in OpenAI get_healing_progress: {str(e)}"}
+
+    async def get_healing_progress_async(self, pdf_path: str) -> Dict:
+        """Async version of get_healing_progress; the PDF is read in a worker thread."""
+        try:
+            messages = await asyncio.to_thread(self._healing_progress_messages, pdf_path)
+
+            print("DEBUG: Sending async request to OpenAI for healing progress analysis...")
+            response_text = await self._make_api_call_async(messages=messages, max_tokens=50, temperature=0.0)
+            json_response = extract_json(response_text)
+
+            return {"success": True, "healing_progress_json": json_response}
+
+        except Exception as e:
+            return {"success": False, "error": f"Error in OpenAI get_healing_progress: {str(e)}"}
+
+atexit.register(OpenAIClient.close_shared_clients)
+# atexit runs hooks last-in first-out, so uploads are deleted before the shared clients are closed
+atexit.register(OpenAIClient.delete_uploaded_images)
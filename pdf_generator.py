@@ -1,10 +1,91 @@
+import hashlib
+import json
 import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
 from fpdf import FPDF
 
+# Records are prepared in parallel before layout; this bounds the worker threads per PDF
+_MAX_RECORD_WORKERS = 4
+
+# The core Helvetica font only covers latin-1. Typographic characters common in model output get a
+# readable latin-1 stand-in; anything else still outside latin-1 becomes '?'.
+_LATIN1_FALLBACKS = str.maketrans({
+    "\u2013": "-", "\u2014": "-", "\u2018": "'", "\u2019": "'", "\u201c": '"', "\u201d": '"',
+    "\u2022": "-", "\u2026": "...", "\u2264": "<=", "\u2265": ">=", "\u2192": "->"
+})
+
+# One [lock, users] entry per patient while a build is in progress, so concurrent requests for the same
+# history build the PDF only once; entries are dropped when their last user is done
+_BUILD_LOCKS = {}
+_BUILD_LOCKS_GUARD = threading.Lock()
+
+# Fingerprint suffix of the generated file names, e.g. "_3_assessments_0123456789abcdef.pdf"
+_HISTORY_PDF_SUFFIX_RE = re.compile(r"\d+_assessments_[0-9a-f]{16}\.pdf")
+# Superseded PDFs are only pruned once untouched for this long, so a concurrent caller that was just
+# handed one still has time to read it (well beyond an API call with its retries)
+_PRUNE_GRACE_SECONDS = 15 * 60
+
+def _history_fingerprint(history_records: list) -> str:
+    """
+    Hashes the normalized history (stable, key-sorted JSON) together with the size and
+    modification time of each referenced image, so a PDF is only reused while both are unchanged.
+    """
+    image_stats = []
+    for record in history_records:
+        try:
+            st = os.stat(record.get('image_path', ''))
+            image_stats.append((st.st_size, st.st_mtime_ns))
+        except OSError:
+            image_stats.append(None)
+    payload = json.dumps([history_records, image_stats], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+@contextmanager
+def _build_lock(patient_id: str):
+    """Holds the patient's build lock, removing it from _BUILD_LOCKS once no other build is waiting on it."""
+    with _BUILD_LOCKS_GUARD:
+        entry = _BUILD_LOCKS.setdefault(patient_id, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _BUILD_LOCKS_GUARD:
+            entry[1] -= 1
+            if not entry[1]:
+                del _BUILD_LOCKS[patient_id]
+
+def _remove_older_history_pdfs(output_folder: str, patient_id: str, keep_path: str) -> None:
+    """
+    Deletes the patient's earlier healing history PDFs, which a changed history has superseded,
+    once they are older than _PRUNE_GRACE_SECONDS. Reusing a PDF refreshes its modification
+    time, so a file that was just returned to another caller is never removed under it.
+    """
+    prefix = f"healing_history_{patient_id}_"
+    keep_name = os.path.basename(keep_path)
+    cutoff = time.time() - _PRUNE_GRACE_SECONDS
+    with os.scandir(output_folder) as entries:
+        for entry in entries:
+            name = entry.name
+            if name != keep_name and name.startswith(prefix) and _HISTORY_PDF_SUFFIX_RE.fullmatch(name, len(prefix)):
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except OSError as e:
+                    print(f"WARNING: Could not remove old healing history PDF {entry.path}: {e}")
+
 def create_healing_history_pdf(history_records: list, patient_id: str, output_folder: str = "generated_pdfs") -> str:
     """
     Generates a multi-page PDF from a list of historical assessment records.
     This is a stateless function that receives all data it needs.
+    The file name carries a fingerprint of the history, so an unchanged history reuses
+    the PDF generated earlier instead of rebuilding it. Building a new one removes the
+    patient's older history PDFs that have not been used for a while.
 
     Args:
         history_records (list): A list of dictionaries, where each dict is an assessment record.
@@ -12,22 +93,71 @@ def create_healing_history_pdf(history_records: list, patient_id: str, output_fo
         output_folder (str): The folder where the generated PDF will be saved.
 
     Returns:
-        str: The file path to the newly created PDF.
+        str: The file path to the generated (or reused) PDF.
     """
     if not history_records:
         raise ValueError("Cannot generate PDF from empty history.")
 
     # Ensure the output folder exists
     os.makedirs(output_folder, exist_ok=True)
-    pdf_path = os.path.join(output_folder, f"healing_history_{patient_id}_{len(history_records)}_assessments.pdf")
-    
+    fingerprint = _history_fingerprint(history_records)
+    pdf_path = os.path.join(output_folder, f"healing_history_{patient_id}_{len(history_records)}_assessments_{fingerprint}.pdf")
+
+    with _build_lock(patient_id):
+        if os.path.exists(pdf_path):
+            print(f"DEBUG: Reusing healing history PDF for unchanged history: {pdf_path}")
+            # Mark it as in use so a concurrent build for a newer history does not prune it yet
+            os.utime(pdf_path)
+            return pdf_path
+        _build_pdf(history_records, pdf_path)
+        _remove_older_history_pdfs(output_folder, patient_id, pdf_path)
+
+    print(f"SUCCESS: Generated healing history PDF at: {pdf_path}")
+    return pdf_path
+
+def _latin1_text(value) -> str:
+    """Returns `value` as text the core PDF fonts can render; ASCII text is returned without copying."""
+    text = str(value)
+    if text.isascii():
+        return text
+    text = text.translate(_LATIN1_FALLBACKS)
+    if max(text) <= "\xff":
+        return text
+    return text.encode('latin-1', 'replace').decode('latin-1')
+
+def _read_image_bytes(record: dict):
+    """Reads a record's image file, or returns None when it is missing or unreadable."""
+    try:
+        with open(record['image_path'], 'rb') as image_file:
+            return image_file.read()
+    except (KeyError, TypeError, OSError):
+        return None
+
+def _prepare_record(record: dict) -> dict:
+    """
+    Does the per-record work that does not touch the FPDF object: reads the image file and
+    converts the two analysis fields to latin-1 text. Records are independent, so this runs in parallel.
+    """
+    analysis = record.get('analysis', {})
+    return {
+        "image_bytes": _read_image_bytes(record),
+        "observations": _latin1_text(analysis.get('Clinical Observations', 'N/A')),
+        "tissue_evaluation": _latin1_text(analysis.get('Wound Tissue Evaluation', 'N/A'))
+    }
+
+def _build_pdf(history_records: list, pdf_path: str) -> None:
+    """Lays out the history PDF and writes it atomically, so a half-written file is never reused."""
     pdf = FPDF()
     pdf.set_auto_page_break(auto=True, margin=15)
 
     # Sort records just in case they are not in order
     sorted_history = sorted(history_records, key=lambda x: x['assessment_date'])
 
-    for i, record in enumerate(sorted_history):
+    # Prepare every record concurrently, so the sequential page layout only makes FPDF calls
+    with ThreadPoolExecutor(max_workers=min(_MAX_RECORD_WORKERS, len(sorted_history))) as executor:
+        prepared_records = list(executor.map(_prepare_record, sorted_history))
+
+    for i, (record, prepared) in enumerate(zip(sorted_history, prepared_records)):
         pdf.add_page()
         pdf.set_font("Helvetica", "B", 16)
         
@@ -39,30 +169,37 @@ def create_healing_history_pdf(history_records: list, patient_id: str, output_fo
 
         # --- Image ---
         try:
+            if prepared["image_bytes"] is None:
+                raise IOError("image file could not be read")
             # A4 width is 210mm. Center a 100mm wide image.
-            pdf.image(record['image_path'], x=(210-100)/2, w=100) 
+            pdf.image(BytesIO(prepared["image_bytes"]), x=(210-100)/2, w=100) 
             pdf.ln(10)
         except Exception as e:
             pdf.set_text_color(255, 0, 0)
-            pdf.cell(0, 10, f"Error loading image: {record['image_path']}", 0, 1)
+            pdf.cell(0, 10, f"Error loading image: {record.get('image_path')}", 0, 1)
             pdf.set_text_color(0, 0, 0)
 
         # --- Key Analysis from JSON ---
-        analysis = record.get('analysis', {})
-        
         pdf.set_font("Helvetica", "B", 12)
         pdf.cell(0, 10, "Clinical Observations:", 0, 1)
         pdf.set_font("Helvetica", "", 10)
-        # Use .encode() to handle potential special characters in the analysis text
-        pdf.multi_cell(0, 5, str(analysis.get('Clinical Observations', 'N/A')).encode('latin-1', 'replace').decode('latin-1'))
+        pdf.multi_cell(0, 5, prepared["observations"])
         pdf.ln(5)
 
         pdf.set_font("Helvetica", "B", 12)
         pdf.cell(0, 10, "Wound Tissue Evaluation:", 0, 1)
         pdf.set_font("Helvetica", "", 10)
-        pdf.multi_cell(0, 5, str(analysis.get('Wound Tissue Evaluation', 'N/A')).encode('latin-1', 'replace').decode('latin-1'))
+        pdf.multi_cell(0, 5, prepared["tissue_evaluation"])
         pdf.ln(5)
 
-    pdf.output(pdf_path)
-    print(f"SUCCESS: Generated healing history PDF at: {pdf_path}")
-    return pdf_path
+    # Serialize the whole document in memory, then write it with a single call and swap it into place
+    pdf_bytes = pdf.output()
+    temp_path = f"{pdf_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, 'wb') as pdf_file:
+            pdf_file.write(pdf_bytes)
+        os.replace(temp_path, pdf_path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
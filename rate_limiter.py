@@ -0,0 +1,101 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Dict, List
+
+# Rough cost of one image or document part; base64 length says little about the provider's token count.
+_ATTACHMENT_TOKEN_ESTIMATE = 1000
+
+def estimate_tokens(messages: List[Dict], max_tokens: int = 0) -> int:
+    """
+    Cheaply estimates the tokens a chat request will consume (about 4 characters per token
+    for text, a flat amount per attachment), plus the requested completion budget.
+    """
+    chars = 0
+    attachments = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    chars += len(part.get("text", ""))
+                else:
+                    attachments += 1
+    return chars // 4 + attachments * _ATTACHMENT_TOKEN_ESTIMATE + max_tokens
+
+
+class RateLimiter:
+    """
+    A thread-safe token-bucket limiter for requests per minute, combined with a sliding
+    one-minute window over estimated tokens per minute.
+    The request rate adapts AIMD-style: it is halved whenever the provider reports a rate
+    limit, and grows by one request per minute after `increase_after` consecutive successes,
+    never exceeding the configured `rpm`.
+    """
+
+    def __init__(self, rpm: int = 60, tpm: int = 150_000, increase_after: int = 10):
+        self.max_rpm = rpm
+        self.tpm = tpm
+        self.increase_after = increase_after
+        self._rpm = float(rpm)
+        self._slots = float(rpm)
+        self._refilled_at = time.monotonic()
+        self._token_window = deque()
+        self._tokens_in_window = 0
+        self._successes = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: int) -> float:
+        """Takes a request slot and records `tokens` if both budgets allow; otherwise returns the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._slots = min(self._rpm, self._slots + (now - self._refilled_at) * self._rpm / 60.0)
+            self._refilled_at = now
+
+            while self._token_window and self._token_window[0][0] <= now - 60.0:
+                self._tokens_in_window -= self._token_window.popleft()[1]
+
+            if self._slots < 1.0:
+                return (1.0 - self._slots) * 60.0 / self._rpm
+            # A single oversized request is let through once the window is empty rather than blocking forever
+            if self._token_window and self._tokens_in_window + tokens > self.tpm:
+                return self._token_window[0][0] + 60.0 - now
+
+            self._slots -= 1.0
+            self._token_window.append((now, tokens))
+            self._tokens_in_window += tokens
+            return 0.0
+
+    def acquire(self, tokens: int = 0) -> None:
+        """Blocks until a request estimated at `tokens` tokens may be sent."""
+        while True:
+            wait = self._reserve(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int = 0) -> None:
+        """Async version of acquire; waits without blocking the event loop."""
+        while True:
+            wait = self._reserve(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def on_success(self) -> None:
+        """Additive increase: one more request per minute after a run of successes."""
+        with self._lock:
+            self._successes += 1
+            if self._successes >= self.increase_after:
+                self._successes = 0
+                self._rpm = min(float(self.max_rpm), self._rpm + 1.0)
+
+    def on_rate_limited(self) -> None:
+        """Multiplicative decrease: halve the request rate after a rate-limit error."""
+        with self._lock:
+            self._successes = 0
+            self._rpm = max(1.0, self._rpm / 2.0)
+            self._slots = min(self._slots, self._rpm)
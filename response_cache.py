@@ -0,0 +1,79 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+class ResponseCache:
+    """
+    A small, thread-safe, in-memory LRU cache for AI responses.
+    Entries can optionally expire after `ttl` seconds.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default: Any = None) -> Any:
+        """Returns the cached value for `key`, or `default` on a miss or an expired entry."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value: Any) -> None:
+        """Stores `value` under `key`, evicting the least recently used entry when full."""
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def make_cache_key(*parts) -> bytes:
+    """
+    Builds a compact blake2b cache key from strings, bytes, numbers and nested
+    lists/dicts of those (e.g. Gemini prompt parts or OpenAI message lists).
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+
+    def feed(part):
+        if isinstance(part, bytes):
+            data = part
+        elif isinstance(part, str):
+            data = part.encode("utf-8")
+        elif isinstance(part, dict):
+            hasher.update(b"d" + len(part).to_bytes(8, "little"))
+            for key in sorted(part):
+                feed(key)
+                feed(part[key])
+            return
+        elif isinstance(part, (list, tuple)):
+            hasher.update(b"l" + len(part).to_bytes(8, "little"))
+            for item in part:
+                feed(item)
+            return
+        else:
+            data = repr(part).encode("utf-8")
+        # Length-prefix each chunk so different splits of the same bytes never collide
+        hasher.update(b"s" + len(data).to_bytes(8, "little"))
+        hasher.update(data)
+
+    feed(parts)
+    return hasher.digest()
@@ -1,4 +1,110 @@
+import json
 import re
+from functools import lru_cache
+from types import MappingProxyType
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers' except clauses still apply.
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+# json5 (optional) accepts trailing commas, single quotes and comments as a last resort.
+try:
+    import json5
+except ImportError:
+    json5 = None
+
+# The seven section headers every initial analysis is expected to contain
+SECTION_KEYS = (
+    "Case Information", "Clinical Observations",
+    "Treatment Plan", "Recommended Products", "Wound Tissue Evaluation", "Wound Summary", "Tissue Percentages Over Time"
+)
+
+# Bold header markers for the linear section scan, e.g. "**Treatment Plan:**"
+_SECTION_MARKERS = tuple((key, f"**{key}:**") for key in SECTION_KEYS)
+
+def _scan_sections(ai_response: str) -> list:
+    """
+    Returns (header, content) pairs in text order by locating each known header marker with
+    str.find and slicing between consecutive markers; no regex backtracking is involved.
+    Unknown bold sub-headers stay inside the content of the section they appear in.
+    """
+    found = []
+    for key, marker in _SECTION_MARKERS:
+        index = ai_response.find(marker)
+        if index >= 0:
+            found.append((index, key, len(marker)))
+    found.sort()
+
+    sections = []
+    for position, (index, key, marker_length) in enumerate(found):
+        end = found[position + 1][0] if position + 1 < len(found) else len(ai_response)
+        sections.append((key, ai_response[index + marker_length:end]))
+    return sections
+
+@lru_cache(maxsize=64)
+def parse_sections(ai_response: str) -> MappingProxyType:
+    """
+    Splits an initial analysis into its known sections with the same scan as
+    AIResponseParser.parse_response_to_json, so both always agree on section boundaries.
+    Results are memoized, so follow-up calls (expand, revise) on the same analysis
+    share one scan. The returned mapping is read-only because it is shared.
+    """
+    return MappingProxyType({header: content.strip() for header, content in _scan_sections(ai_response)})
+
+_FENCE_TAG_RE = re.compile(r'```(?:json)?', re.IGNORECASE)
+
+def _balanced_json_slice(text: str, start: int) -> str:
+    """Returns the JSON value starting at `start`, up to its matching closing brace (brackets and strings respected)."""
+    depth = 0
+    in_string = False
+    escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            depth += 1
+        elif char in '}]':
+            depth -= 1
+            if depth == 0:
+                return text[start:index + 1]
+    return text[start:]
+
+def extract_json(text: str):
+    """
+    Tolerantly parses the JSON object in a model reply that may wrap it in markdown fences
+    or surrounding prose. Tries the whole (fence-stripped) text first, then the first
+    brace-balanced object, then json5 if installed.
+    Raises json.JSONDecodeError when no JSON object can be recovered.
+    """
+    cleaned = _FENCE_TAG_RE.sub('', text).strip()
+    try:
+        return json_loads(cleaned)
+    except json.JSONDecodeError:
+        pass
+
+    start = cleaned.find('{')
+    if start == -1:
+        raise json.JSONDecodeError("No JSON object found in the response", cleaned, 0)
+    candidate = _balanced_json_slice(cleaned, start)
+    try:
+        return json_loads(candidate)
+    except json.JSONDecodeError:
+        if json5 is None:
+            raise
+    try:
+        return json5.loads(candidate)
+    except ValueError as e:
+        raise json.JSONDecodeError(str(e), candidate, 0)
 
 class AIResponseParser:
     """Parses the raw text output from the AI into a structured format."""
@@ -6,32 +112,24 @@ class AIResponseParser:
     def parse_response_to_json(self, ai_response: str) -> dict:
         """
         Parses the AI's full markdown response into a single JSON object.
-        This version uses a more specific regex to avoid capturing sub-headers.
+        Sections are split on the known headers only, to avoid capturing sub-headers.
         """
         # For debugging
         print("\n--- RAW AI RESPONSE (SINGLE CALL) ---")
         print(ai_response)
         print("-------------------------------------\n")
 
-        # Define all the section headers we expect in the single response
-        section_keys = [
-            "Case Information", "Clinical Observations",
-            "Treatment Plan", "Recommended Products", "Wound Tissue Evaluation", "Wound Summary", "Tissue Percentages Over Time"
-        ]
-        
-        response_json = {key: "" for key in section_keys}
-
-        # --- THIS IS THE CORRECTED REGEX ---
-        # 1. Create a string of our specific headers separated by '|' (which means OR in regex)
-        #    This will look like: 'Case Information|Clinical Observations|Wound Summary|...'
-        lookahead_headers = '|'.join(re.escape(key) for key in section_keys)
-        
-        # 2. Build the new, more specific pattern.
-        #    It now looks ahead for `**` followed by one of our EXACT headers, then `:`
-        pattern = re.compile(r'\*\*(.*?):\*\*(.*?)(?=\*\*(?:' + lookahead_headers + r'):|\Z)', re.DOTALL)
-        # ------------------------------------
-        
-        matches = pattern.findall(ai_response)
+        # All the section headers we expect in the single response
+        response_json = {key: "" for key in SECTION_KEYS}
+
+        # Empty, truncated or error replies lack both leading headers; skip the section scan for them
+        if "**Case Information:**" not in ai_response and "**Clinical Observations:**" not in ai_response:
+            print("WARNING: Parsing failed. The AI response is missing the Case Information and Clinical Observations headers.")
+            response_json["error"] = "Parsing failed. AI response did not contain expected headers."
+            return response_json
+
+        # Only our EXACT headers delimit sections, so sub-headers are not captured as sections
+        matches = _scan_sections(ai_response)
 
         if not matches:
             print("WARNING: Parsing failed. No section headers found in the AI response.")
@@ -0,0 +1,93 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("httpx")
+pytest.importorskip("dotenv")
+
+import openai_client
+from openai_client import OpenAIClient
+
+
+class FakeBatches:
+    def __init__(self, statuses, output_file_id="out", error_file_id=None):
+        self.statuses = list(statuses)
+        self.output_file_id = output_file_id
+        self.error_file_id = error_file_id
+        self.retrievals = 0
+
+    def retrieve(self, batch_id):
+        status = self.statuses[min(self.retrievals, len(self.statuses) - 1)]
+        self.retrievals += 1
+        return SimpleNamespace(status=status, output_file_id=self.output_file_id, error_file_id=self.error_file_id)
+
+
+def _result_line(custom_id, status_code=200, content="analysis"):
+    body = {"choices": [{"message": {"content": content}}]} if status_code == 200 else {"error": {}}
+    return json.dumps({"custom_id": custom_id, "response": {"status_code": status_code, "body": body}})
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    return OpenAIClient()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(openai_client.time, "sleep", recorded.append)
+    return recorded
+
+
+def _attach(client, batches, files=None):
+    client.client = SimpleNamespace(
+        batches=batches,
+        files=SimpleNamespace(content=lambda file_id: SimpleNamespace(text=(files or {})[file_id]))
+    )
+
+
+def test_polling_backs_off_exponentially_up_to_the_cap(client, sleeps):
+    batches = FakeBatches(["validating"] + ["in_progress"] * 8 + ["completed"])
+    _attach(client, batches, {"out": _result_line("a")})
+
+    assert client.wait_for_batch_analysis("batch_1") == {"a": "analysis"}
+    assert sleeps == [5.0, 10.0, 20.0, 40.0, 80.0, 160.0, 300.0, 300.0, 300.0]
+
+
+def test_completed_batch_returns_failed_requests_as_none(client, sleeps):
+    batches = FakeBatches(["completed"], output_file_id="out", error_file_id="err")
+    _attach(client, batches, {
+        "out": _result_line("ok") + "\n\n" + _result_line("bad", status_code=500),
+        "err": _result_line("lost", status_code=400)
+    })
+
+    assert client.wait_for_batch_analysis("batch_1") == {"ok": "analysis", "bad": None, "lost": None}
+    assert sleeps == []
+
+
+def test_polling_stops_at_the_timeout(client, monkeypatch):
+    now = {"t": 0.0}
+    sleeps = []
+
+    def fake_sleep(delay):
+        sleeps.append(delay)
+        now["t"] += delay
+
+    monkeypatch.setattr(openai_client.time, "monotonic", lambda: now["t"])
+    monkeypatch.setattr(openai_client.time, "sleep", fake_sleep)
+    _attach(client, FakeBatches(["in_progress"]))
+
+    with pytest.raises(TimeoutError):
+        client.wait_for_batch_analysis("batch_1", timeout=30)
+    # Waiting another 20 s would overshoot the 30 s budget, so no third poll is slept through
+    assert sleeps == [5.0, 10.0]
+
+
+def test_failed_batch_raises(client, sleeps):
+    _attach(client, FakeBatches(["in_progress", "failed"]))
+
+    with pytest.raises(Exception, match="failed"):
+        client.wait_for_batch_analysis("batch_1")
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("httpx")
+pytest.importorskip("dotenv")
+
+import client_factory
+import openai_client
+from openai_client import OpenAIClient
+
+
+@pytest.fixture
+def api_key(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(client_factory, "_CLIENT_CACHE", {})
+    return "test-key"
+
+
+def _system_bytes(client: OpenAIClient) -> bytes:
+    messages = client._initial_analysis_messages("prompt", "aW1hZ2U=")
+    return json.dumps(messages[0], ensure_ascii=False).encode("utf-8")
+
+
+def test_short_protocol_is_the_full_protocol_without_the_timeseries_parts():
+    assert openai_client._CLINICAL_PROTOCOL_NO_TIMESERIES == (
+        openai_client._CP_HEADERS + openai_client._CP_EXAMPLES_CORE + openai_client._CP_CLOSING
+    )
+    assert "Tissue Percentages Over Time" in openai_client._CLINICAL_PROTOCOL
+    assert "Tissue Percentages Over Time" not in openai_client._CLINICAL_PROTOCOL_NO_TIMESERIES
+
+
+def test_each_variant_is_byte_identical_across_instances_and_calls(api_key):
+    full_a, full_b = OpenAIClient(), OpenAIClient()
+    short_a, short_b = OpenAIClient(include_timeseries=False), OpenAIClient(include_timeseries=False)
+
+    assert _system_bytes(full_a) == _system_bytes(full_b) == _system_bytes(full_a)
+    assert _system_bytes(short_a) == _system_bytes(short_b) == _system_bytes(short_a)
+    assert _system_bytes(full_a) != _system_bytes(short_a)
+    assert short_a.clinical_protocol is openai_client._CLINICAL_PROTOCOL_NO_TIMESERIES
+
+
+def test_each_variant_has_its_own_stable_prompt_cache_key():
+    full_key = openai_client._prompt_cache_key(openai_client._CLINICAL_PROTOCOL)
+    short_key = openai_client._prompt_cache_key(openai_client._CLINICAL_PROTOCOL_NO_TIMESERIES)
+
+    assert full_key == openai_client._prompt_cache_key(openai_client._CLINICAL_PROTOCOL)
+    assert full_key != short_key
+
+
+def test_factory_forwards_include_timeseries(api_key):
+    default_client = client_factory.get_ai_client("gpt-4o")
+    short_client = client_factory.get_ai_client("gpt-4o", include_timeseries=False)
+
+    assert short_client is not default_client
+    assert short_client is client_factory.get_ai_client("gpt-4o", include_timeseries=False)
+    assert default_client.clinical_protocol is openai_client._CLINICAL_PROTOCOL
+    assert short_client.clinical_protocol is openai_client._CLINICAL_PROTOCOL_NO_TIMESERIES
@@ -0,0 +1,78 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip("fpdf")
+
+import pdf_generator
+from pdf_generator import _history_fingerprint, _latin1_text, _remove_older_history_pdfs
+
+
+def _record(image_path, **fields):
+    return {"image_path": str(image_path), "assessment_date": "2025-10-01 09:00:00", "analysis": {"Wound Summary": "ok"}, **fields}
+
+
+def test_history_fingerprint_is_stable_and_ignores_key_order(tmp_path):
+    image = tmp_path / "wound.png"
+    image.write_bytes(b"image")
+    record = _record(image)
+    reordered = dict(reversed(list(record.items())))
+
+    assert _history_fingerprint([record]) == _history_fingerprint([reordered])
+    assert len(_history_fingerprint([record])) == 16
+
+
+def test_history_fingerprint_changes_with_the_records(tmp_path):
+    image = tmp_path / "wound.png"
+    image.write_bytes(b"image")
+
+    assert _history_fingerprint([_record(image)]) != _history_fingerprint([_record(image, assessment_date="2025-10-02 09:00:00")])
+    assert _history_fingerprint([_record(image)]) != _history_fingerprint([_record(image), _record(image)])
+
+
+def test_history_fingerprint_changes_when_an_image_is_replaced(tmp_path):
+    image = tmp_path / "wound.png"
+    image.write_bytes(b"image")
+    before = _history_fingerprint([_record(image)])
+
+    image.write_bytes(b"a different image")
+    os.utime(image, ns=(0, 10 ** 9))
+
+    assert _history_fingerprint([_record(image)]) != before
+
+
+def test_history_fingerprint_tolerates_missing_images(tmp_path):
+    assert _history_fingerprint([_record(tmp_path / "missing.png")])
+
+
+def test_latin1_text_returns_ascii_unchanged():
+    text = "Granulation: 90%"
+
+    assert _latin1_text(text) is text
+    assert _latin1_text(42) == "42"
+
+
+def test_latin1_text_maps_typographic_characters():
+    assert _latin1_text("“moist” – 48–72h ≤ 2 cm…") == '"moist" - 48-72h <= 2 cm...'
+
+
+def test_latin1_text_keeps_latin1_and_replaces_the_rest():
+    assert _latin1_text("14 × 8 cm") == "14 × 8 cm"
+    assert _latin1_text("✔ healed") == "? healed"
+
+
+def test_superseded_pdfs_are_pruned_only_after_the_grace_period(tmp_path):
+    keep = tmp_path / "healing_history_p1_3_assessments_aaaaaaaaaaaaaaaa.pdf"
+    stale = tmp_path / "healing_history_p1_2_assessments_0123456789abcdef.pdf"
+    recent = tmp_path / "healing_history_p1_1_assessments_fedcba9876543210.pdf"
+    other_patient = tmp_path / "healing_history_p1_x_2_assessments_0123456789abcdef.pdf"
+    for path in (keep, stale, recent, other_patient):
+        path.write_bytes(b"%PDF")
+    old = time.time() - pdf_generator._PRUNE_GRACE_SECONDS - 60
+    for path in (keep, stale, other_patient):
+        os.utime(path, (old, old))
+
+    _remove_older_history_pdfs(str(tmp_path), "p1", str(keep))
+
+    assert sorted(os.listdir(tmp_path)) == sorted([keep.name, recent.name, other_patient.name])
@@ -0,0 +1,85 @@
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimiter, estimate_tokens
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    state = {"now": 1000.0}
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: state["now"])
+    return state
+
+
+def test_rate_limit_halves_the_request_rate_down_to_one():
+    limiter = RateLimiter(rpm=60)
+
+    limiter.on_rate_limited()
+    assert limiter._rpm == 30.0
+    for _ in range(10):
+        limiter.on_rate_limited()
+    assert limiter._rpm == 1.0
+
+
+def test_successes_raise_the_rate_by_one_up_to_the_configured_rpm():
+    limiter = RateLimiter(rpm=60, increase_after=3)
+    limiter.on_rate_limited()
+
+    for _ in range(2):
+        limiter.on_success()
+    assert limiter._rpm == 30.0
+    limiter.on_success()
+    assert limiter._rpm == 31.0
+
+    for _ in range(3 * 100):
+        limiter.on_success()
+    assert limiter._rpm == 60.0
+
+
+def test_rate_limit_resets_the_success_streak():
+    limiter = RateLimiter(rpm=60, increase_after=3)
+    limiter.on_success()
+    limiter.on_success()
+    limiter.on_rate_limited()
+    limiter.on_success()
+
+    assert limiter._rpm == 30.0
+
+
+def test_requests_wait_once_the_slots_are_used_up(clock):
+    limiter = RateLimiter(rpm=2, tpm=10 ** 9)
+
+    assert limiter._reserve(0) == 0.0
+    assert limiter._reserve(0) == 0.0
+    # Slots refill at rpm / 60 per second, so the next one is 30 seconds away
+    assert limiter._reserve(0) == pytest.approx(30.0)
+    clock["now"] += 30.0
+    assert limiter._reserve(0) == 0.0
+
+
+def test_token_budget_is_a_sliding_one_minute_window(clock):
+    limiter = RateLimiter(rpm=1000, tpm=100)
+
+    assert limiter._reserve(80) == 0.0
+    clock["now"] += 20.0
+    assert limiter._reserve(30) == pytest.approx(40.0)
+    clock["now"] += 40.0
+    assert limiter._reserve(30) == 0.0
+
+
+def test_a_single_oversized_request_is_let_through_on_an_empty_window(clock):
+    limiter = RateLimiter(rpm=1000, tpm=100)
+
+    assert limiter._reserve(500) == 0.0
+
+
+def test_estimate_tokens_counts_text_attachments_and_completion_budget():
+    messages = [
+        {"role": "system", "content": "x" * 400},
+        {"role": "user", "content": [
+            {"type": "text", "text": "y" * 40},
+            {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64,AAAA"}}
+        ]}
+    ]
+
+    assert estimate_tokens(messages, max_tokens=50) == 110 + rate_limiter._ATTACHMENT_TOKEN_ESTIMATE + 50
@@ -0,0 +1,67 @@
+import response_cache
+from response_cache import ResponseCache, make_cache_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(response_cache.time, "monotonic", clock)
+    cache = ResponseCache(maxsize=4, ttl=10)
+
+    cache.set("key", "value")
+    clock.now += 9.9
+    assert cache.get("key") == "value"
+    clock.now += 0.2
+    assert cache.get("key", "missing") == "missing"
+    assert len(cache) == 0
+
+
+def test_entries_without_ttl_never_expire(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(response_cache.time, "monotonic", clock)
+    cache = ResponseCache(maxsize=4)
+
+    cache.set("key", "value")
+    clock.now += 10 ** 9
+    assert cache.get("key") == "value"
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # Reading "a" makes "b" the least recently used entry
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_overwriting_a_key_does_not_grow_the_cache():
+    cache = ResponseCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("a", 2)
+
+    assert cache.get("a") == 2
+    assert len(cache) == 1
+
+
+def test_make_cache_key_is_stable_and_order_independent_for_dicts():
+    assert make_cache_key("gpt-4o", {"a": 1, "b": [1, 2]}) == make_cache_key("gpt-4o", {"b": [1, 2], "a": 1})
+    assert len(make_cache_key("x")) == 16
+
+
+def test_make_cache_key_distinguishes_different_splits_and_types():
+    assert make_cache_key("ab", "c") != make_cache_key("a", "bc")
+    assert make_cache_key(["a", "b"]) != make_cache_key("a", "b")
+    assert make_cache_key(b"abc") != make_cache_key("abc", 1)
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from response_parser import AIResponseParser, SECTION_KEYS, _scan_sections, extract_json, parse_sections
+
+ANALYSIS = (
+    "**Case Information:**\nPatient: test\n"
+    "**Clinical Observations:**\nClean wound.\n"
+    "**Treatment Plan:**\n**Wound Care Recommendations:**\n1. Irrigate.\n"
+    "**Recommended Products:**\n- Saline\n"
+    "**Wound Tissue Evaluation:**\n- **Granulation:** 90%\n"
+)
+
+
+def test_extract_json_accepts_a_bare_object():
+    assert extract_json('{"a": 1}') == {"a": 1}
+
+
+def test_extract_json_strips_markdown_fences():
+    assert extract_json('```json\n{"a": [1, 2]}\n```') == {"a": [1, 2]}
+
+
+def test_extract_json_finds_a_balanced_object_inside_prose():
+    text = 'Here you go: {"plan": {"step": "use {braces} and \\"quotes\\""}} Hope this helps! {"other": 1}'
+
+    assert extract_json(text) == {"plan": {"step": 'use {braces} and "quotes"'}}
+
+
+def test_extract_json_raises_a_decode_error_without_an_object():
+    with pytest.raises(json.JSONDecodeError):
+        extract_json("I cannot help with that.")
+
+
+def test_scan_sections_returns_known_sections_in_text_order():
+    sections = _scan_sections(ANALYSIS)
+
+    assert [key for key, _ in sections] == ["Case Information", "Clinical Observations", "Treatment Plan", "Recommended Products", "Wound Tissue Evaluation"]
+    # Unknown bold sub-headers stay inside their section
+    assert "**Wound Care Recommendations:**" in dict(sections)["Treatment Plan"]
+
+
+def test_scan_sections_follows_the_text_when_headers_are_reordered():
+    text = "**Recommended Products:** p **Case Information:** c"
+
+    assert _scan_sections(text) == [("Recommended Products", " p "), ("Case Information", " c")]
+
+
+def test_scan_sections_without_markers_is_empty():
+    assert _scan_sections("no headers here") == []
+
+
+def test_parse_sections_agrees_with_parse_response_to_json():
+    text = "**Case Information:** c **Recommended Products:** p **Treatment Plan:** t **Treatment Plan:** again"
+    parsed = AIResponseParser().parse_response_to_json(text)
+
+    for key, content in parse_sections(text).items():
+        assert parsed[key] == content
+
+
+def test_parse_response_to_json_fills_every_key():
+    parsed = AIResponseParser().parse_response_to_json(ANALYSIS)
+
+    assert set(SECTION_KEYS) <= set(parsed)
+    assert parsed["Recommended Products"] == "- Saline"
+    assert parsed["Wound Summary"] == ""
+    assert "error" not in parsed
+
+
+def test_parse_response_to_json_reports_replies_without_leading_headers():
+    parsed = AIResponseParser().parse_response_to_json("**Treatment Plan:** only a plan")
+
+    assert parsed["error"] == "Parsing failed. AI response did not contain expected headers."
+    assert parsed["Treatment Plan"] == ""